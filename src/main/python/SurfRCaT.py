@@ -15,33 +15,30 @@ __version__ = '2.0'
 #============================================================================#
 # Get WebCAT video #
 #============================================================================#
-def GetWebCATVideo(pth,camToInput,year,month,day,hour):
-    
+def GetWebCATURL(camToInput,year,month,day,hour):
+
     """
-    Function to download a video clip from a specified WebCAT camera to local directory. The desired year, month, day, and time must be given, 
-    An examination of WebCAT clips on the website can help determine the desired date/time to use. 
-    
+    Function to build the URL of a WebCAT video clip and the name of the clip file.
+
     Inputs:
-        pth: (string) File location to save file to
         camToInput: (string) name of WebCAT camera you want imagery for
         year: (int) year of date you want video for
         month: (int) month of date you want video for
         day: (int) day of date you want video for
         hour: (int) hour of date you want video for
-        
+
     Outputs:
-        vidFile: (string) path to downloaded video file 
-    
+        url: (string) URL of the video clip
+        vidFile: (string) name of the video clip file
+
     """
 
-    import requests
-    
     # Add zeros to day and month values if needed #
     if month<10:
         month = '0'+str(month)
     else:
         month = str(month)
-    
+
     if day<10:
         day = '0'+str(day)
     else:
@@ -51,33 +48,457 @@ def GetWebCATVideo(pth,camToInput,year,month,day,hour):
         hour = '0'+str(hour)
     else:
         hour = str(hour)
-       
-    # Get the video URL # 
-    url = 'http://webcat-video.axds.co/{}/raw/{}/{}_{}/{}_{}_{}/{}.{}-{}-{}_{}.mp4'.format(camToInput,year,year,month,year,month,day,camToInput,year,month,day,hour)   
-    
+
+    # Get the video URL #
+    url = 'http://webcat-video.axds.co/{}/raw/{}/{}_{}/{}_{}_{}/{}.{}-{}-{}_{}.mp4'.format(camToInput,year,year,month,year,month,day,camToInput,year,month,day,hour)
+
+    # Get the video file name #
+    vidFile = camToInput+'.'+str(year)+'-'+month+'-'+day+'_'+str(hour)+'.mp4'
+
+    return url,vidFile
+
+
+def GetWebCATVideo(pth,camToInput,year,month,day,hour,session=None):
+
+    """
+    Function to download a video clip from a specified WebCAT camera to local directory. The desired year, month, day, and time must be given,
+    An examination of WebCAT clips on the website can help determine the desired date/time to use.
+
+    The clip is downloaded to a temporary .part file, which is only renamed to the clip name once its size (and checksum,
+    if the server gives one) is verified. If a .part file is left from an interrupted download, the download is resumed
+    from where it stopped with an HTTP Range request.
+
+    Inputs:
+        pth: (string) File location to save file to
+        camToInput: (string) name of WebCAT camera you want imagery for
+        year: (int) year of date you want video for
+        month: (int) month of date you want video for
+        day: (int) day of date you want video for
+        hour: (int) hour of date you want video for
+        session: (object) Optional requests.Session to download with, so that the connection can be re-used
+                 between clips. If not given, a new connection is made.
+
+    Outputs:
+        vidFile: (string) path to downloaded video file, or None if the clip does not exist on the server
+
+    """
+
+    import base64
+    import hashlib
+    import os
+    import requests
+
+    url,vidFile = GetWebCATURL(camToInput,year,month,day,hour)
+
     # Read and load the video file from that URL #
+    if session is None:
+        session = requests
     filename = url.split('/')[-1] # Get the filename as everything after the last backslash #
-    r = requests.get(url,stream = True) # Create the Response Object, which contains all of the information about the file and file location %
-    with open(pth+filename,'wb') as f: # This loop does the downloading 
-        for chunk in r.iter_content(chunk_size = 1024*1024):
-            if chunk:
-                f.write(chunk)
-    
+    partFile = pth+filename+'.part'
+    if os.path.exists(partFile):
+        pos = os.path.getsize(partFile)
+    else:
+        pos = 0
+    if pos>0:
+        r = session.get(url,stream = True,headers = {'Range':'bytes='+str(pos)+'-'}) # Ask only for the part of the file we don't have yet #
+    else:
+        r = session.get(url,stream = True) # Create the Response Object, which contains all of the information about the file and file location %
+
+    # Work out where to start writing and how big the complete file should be #
+    total = None
+    if r.status_code == 206:
+        mode = 'ab'
+        total = int(r.headers['Content-Range'].split('/')[-1])
+    elif r.status_code == 416: # The part file already holds the whole clip, or is not a part of this clip at all #
+        r.close()
+        if 'Content-Range' not in r.headers:
+            os.remove(partFile)
+            raise IOError('Could not resume download of '+filename)
+        mode = None
+        total = int(r.headers['Content-Range'].split('/')[-1])
+        if pos != total: # Stale or oversized, so it can never be resumed. Start again from the beginning #
+            os.remove(partFile)
+            return GetWebCATVideo(pth,camToInput,year,month,day,hour,session)
+    elif r.status_code == 200:
+        mode = 'wb'
+        if 'Content-Length' in r.headers:
+            total = int(r.headers['Content-Length'])
+    elif r.status_code>=500:
+        r.close()
+        r.raise_for_status() # Server errors are worth retrying, so let the caller know about them #
+    else: # The clip does not exist #
+        r.close()
+        return None
+
+    # Get the checksum of the complete file, if the server gives one. An ETag is only used if it looks like an MD5 hash #
+    md5 = None
+    etag = r.headers.get('ETag','').strip('"')
+    if len(etag) == 32 and all(c in '0123456789abcdef' for c in etag.lower()):
+        md5 = etag.lower()
+    elif r.status_code == 200 and 'Content-MD5' in r.headers:
+        md5 = base64.b64decode(r.headers['Content-MD5']).hex()
+
+    if mode is not None:
+        with open(partFile,mode) as f: # This loop does the downloading
+            for chunk in r.iter_content(chunk_size = 1024*1024):
+                if chunk:
+                    f.write(chunk)
+    r.close()
+
+    # Check the download is complete before moving it into place. An incomplete part file is kept so the download can be resumed #
+    if total is not None and os.path.getsize(partFile) != total:
+        raise IOError('Incomplete download of '+filename)
+    if md5 is not None:
+        h = hashlib.md5()
+        with open(partFile,'rb') as f:
+            for chunk in iter(lambda: f.read(1024*1024),b''):
+                h.update(chunk)
+        if h.hexdigest() != md5:
+            os.remove(partFile)
+            raise IOError('Checksum mismatch for '+filename)
+    os.replace(partFile,pth+filename)
+
     ## The specified video is now saved to the directory ##
-    
-    # Get the video file name #
-    vidFile = camToInput+'.'+str(year)+'-'+month+'-'+day+'_'+str(hour)+'.mp4'
-       
+
     return vidFile
 
 
+def GetWebCATVideos(pth,camToInput,years,months,days,hours,numWorkers=4,maxPerHost=2,retries=3,backoff=1,progressFcn=None):
+
+    """
+    Function to download a batch of WebCAT video clips concurrently. Clips are downloaded by a bounded pool of worker
+    threads. Each host gets one keep-alive session (shared by the workers) and a limit on the number of clips downloaded
+    from it at once. Failed downloads are retried with an exponential backoff, resuming from the part of the clip already
+    downloaded. Clips that already exist in pth are skipped.
+
+    Inputs:
+        pth: (string) File location to save files to
+        camToInput: (string) name of WebCAT camera you want imagery for
+        years: (list) years of the dates you want videos for
+        months: (list) months of the dates you want videos for
+        days: (list) days of the dates you want videos for
+        hours: (list) hours of the dates you want videos for
+        numWorkers: (int) Number of worker threads
+        maxPerHost: (int) Maximum number of clips to download from a single host at once
+        retries: (int) Number of times to retry a failed download
+        backoff: (float) Time (in seconds) to wait before the first retry. The wait doubles for each following retry.
+        progressFcn: (function) Optional function called with the number of finished clips each time a clip finishes
+
+    Outputs:
+        vidFiles: (list) names of the video files, in the same order as the input dates. Clips that do not exist or could not
+                  be downloaded are None.
+
+    """
+
+    import os
+    import requests
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor,as_completed
+    from urllib.parse import urlparse
+
+    # One session and one concurrency limit per host #
+    sessions = {}
+    limits = {}
+    lock = threading.Lock()
+    def getHost(url):
+        host = urlparse(url).netloc
+        with lock:
+            if host not in sessions:
+                s = requests.Session()
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1,pool_maxsize=maxPerHost)
+                s.mount('http://',adapter)
+                s.mount('https://',adapter)
+                sessions[host] = s
+                limits[host] = threading.Semaphore(maxPerHost)
+        return sessions[host],limits[host]
+
+    def download(yr,mo,d,hr):
+        url,vidFile = GetWebCATURL(camToInput,yr,mo,d,hr)
+        if os.path.exists(pth+vidFile): # Only download if the file doesn't already exist #
+            return vidFile
+        session,limit = getHost(url)
+        for attempt in range(0,retries+1):
+            try:
+                with limit:
+                    return GetWebCATVideo(pth,camToInput,yr,mo,d,hr,session=session)
+            except (requests.exceptions.RequestException,OSError):
+                if attempt == retries:
+                    raise
+                time.sleep(backoff*(2**attempt))
+
+    vidFiles = [None]*len(years)
+    numDone = 0
+    with ThreadPoolExecutor(max_workers=numWorkers) as pool:
+        futures = {pool.submit(download,int(years[i]),int(months[i]),int(days[i]),int(hours[i])):i for i in range(0,len(years))}
+        for future in as_completed(futures):
+            try:
+                vidFiles[futures[future]] = future.result()
+            except (requests.exceptions.RequestException,OSError):
+                pass
+            numDone = numDone+1
+            if progressFcn is not None:
+                progressFcn(numDone)
+
+    for s in sessions.values():
+        s.close()
+
+    return vidFiles
+
+
+def GetWebCATAvailability(camToInput,years,months,days,hours,indexFile=None,numWorkers=8,maxAge=86400):
+
+    """
+    Function to find which of a set of WebCAT video clips exist, without downloading them. Each clip is checked with a HEAD
+    request, and the checks are run concurrently. If an index file is given, the results are stored in it so clips never need
+    to be checked twice. Clips found to exist are never re-checked; clips found missing are re-checked once the
+    result is older than maxAge, since clips can be uploaded late.
+
+    Inputs:
+        camToInput: (string) name of WebCAT camera you want imagery for
+        years: (list) years of the dates you want videos for
+        months: (list) months of the dates you want videos for
+        days: (list) days of the dates you want videos for
+        hours: (list) hours of the dates you want videos for
+        indexFile: (string) Optional path to the pickle file holding this camera's availability index
+        numWorkers: (int) Number of HEAD requests to run at once
+        maxAge: (float) Time (in seconds) after which a missing clip is checked again
+
+    Outputs:
+        available: (list) True or False for each input date, in the same order as the input dates
+
+    """
+
+    import os
+    import pickle
+    import requests
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    # Load the existing index. Keys are (year,month,day,hour) and values are (exists,time checked) #
+    index = {}
+    if indexFile is not None and os.path.exists(indexFile):
+        with open(indexFile,'rb') as f:
+            index = pickle.load(f)
+
+    clips = [(int(years[i]),int(months[i]),int(days[i]),int(hours[i])) for i in range(0,len(years))]
+    now = time.time()
+    toCheck = [c for c in set(clips) if c not in index or (not index[c][0] and now-index[c][1]>maxAge)]
+
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1,pool_maxsize=numWorkers)
+    session.mount('http://',adapter)
+    session.mount('https://',adapter)
+    def check(clip):
+        url,vidFile = GetWebCATURL(camToInput,*clip)
+        try:
+            r = session.head(url,allow_redirects=True)
+        except requests.exceptions.RequestException:
+            return None
+        if r.status_code == 200:
+            return True
+        elif r.status_code in (403,404):
+            return False
+        else:
+            return None # Don't know, so don't store it #
+
+    with ThreadPoolExecutor(max_workers=numWorkers) as pool:
+        results = list(pool.map(check,toCheck))
+    session.close()
+
+    for clip,exists in zip(toCheck,results):
+        if exists is not None:
+            index[clip] = (exists,now)
+
+    if indexFile is not None and toCheck:
+        os.makedirs(os.path.dirname(os.path.abspath(indexFile)),exist_ok=True)
+        with open(indexFile+'.tmp','wb') as f:
+            pickle.dump(index,f)
+        os.replace(indexFile+'.tmp',indexFile)
+
+    # Clips we could not check are assumed to exist so that the download can decide #
+    available = [index[c][0] if c in index else True for c in clips]
+
+    return available
+
+
+def GetWebCATClips(camToInput,startDate,endDate,hours=None,indexFile=None,numWorkers=8):
+
+    """
+    Function to expand a range of dates into the WebCAT video clips that actually exist over that range.
+
+    Inputs:
+        camToInput: (string) name of WebCAT camera you want imagery for
+        startDate: (datetime.date) first date of the range
+        endDate: (datetime.date) last date of the range (inclusive)
+        hours: (list) Optional hours (in HHMM format, e.g. 1310) to get clips for on each day. If not given, every 10-minute clip
+               of the day is used.
+        indexFile: (string) Optional path to the pickle file holding this camera's availability index
+        numWorkers: (int) Number of HEAD requests to run at once
+
+    Outputs:
+        clips: (list) (year,month,day,hour) of each clip that exists, in time order
+
+    """
+
+    import datetime
+
+    if hours is None:
+        hours = [(h*100)+m for h in range(0,24) for m in range(0,60,10)]
+
+    clips = []
+    d = startDate
+    while d<=endDate:
+        for hr in hours:
+            clips.append((d.year,d.month,d.day,hr))
+        d = d+datetime.timedelta(days=1)
+
+    available = GetWebCATAvailability(camToInput,[c[0] for c in clips],[c[1] for c in clips],[c[2] for c in clips],[c[3] for c in clips],
+                                      indexFile=indexFile,numWorkers=numWorkers)
+    clips = [c for c,a in zip(clips,available) if a]
+
+    return clips
+
+
+def GetVideoList(vids):
+    '''
+    Function to get a list of video files.
+
+    Inputs:
+        vids: (str or list) A directory of videos, a glob pattern (e.g. 'C:/videos/*.mp4'), or a list of video paths
+    Outputs:
+        vids: (list) Paths of the videos
+
+    '''
+
+    import glob
+    import os
+
+    if isinstance(vids,str):
+        if os.path.isdir(vids):
+            vids = sorted([os.path.join(vids,f) for f in os.listdir(vids) if os.path.splitext(f)[1].lower() in ('.mp4','.avi','.mov','.mkv')])
+        else:
+            vids = sorted(glob.glob(vids))
+
+    return list(vids)
+
+
+def GetVideoCatalog(vids,catalogFile,checksum=False,numWorkers=4):
+    '''
+    Function to get information about local videos from a persistent catalog, so that videos do not have to be opened
+    again to find their length. The catalog is updated incrementally: a video is only opened (and checksummed) if it is new
+    or its size or modification time have changed since it was catalogued. Videos that no longer exist are dropped.
+
+    Inputs:
+        vids: (str or list) A directory of videos, a glob pattern, or a list of video paths (see GetVideoList)
+        catalogFile: (str) Path to the pickle file holding the catalog
+        checksum: (bool) If True, compute the MD5 checksum of videos that do not have one yet. This reads each whole file.
+        numWorkers: (int) Number of videos to open at once
+    Outputs:
+        entries: (dict) Information about each of the input videos that exists, keyed by its absolute path. Each is a dict of:
+            'camera': (str) WebCAT camera name, from the file name (None if not a WebCAT clip)
+            'timestamp': (datetime) Start time of the clip, from the file name (None if not a WebCAT clip)
+            'duration': (float) Length of the video in seconds
+            'fps': (float) Frame rate of the video
+            'frames': (int) Number of frames in the video (0 if it could not be read as a video)
+            'size': (int) Size of the file in bytes
+            'mtime': (float) Modification time of the file
+            'md5': (str) MD5 checksum of the file (None if not computed)
+
+    '''
+
+    import cv2
+    import datetime
+    import hashlib
+    import os
+    import pickle
+    import re
+    from concurrent.futures import ThreadPoolExecutor
+
+    catalog = {}
+    if os.path.exists(catalogFile):
+        with open(catalogFile,'rb') as f:
+            catalog = pickle.load(f)
+
+    paths = [os.path.abspath(v) for v in GetVideoList(vids)]
+
+    def probe(path):
+        stat = os.stat(path)
+        entry = catalog.get(path)
+        if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+            entry = {'camera':None,'timestamp':None,'size':stat.st_size,'mtime':stat.st_mtime,'md5':None}
+            name = re.match(r'^(.+)\.(\d{4})-(\d{2})-(\d{2})_(\d{2})(\d{2})\.mp4$',os.path.basename(path)) # WebCAT clip names #
+            if name:
+                entry['camera'] = name.group(1)
+                entry['timestamp'] = datetime.datetime(*[int(g) for g in name.groups()[1:]])
+            cap = cv2.VideoCapture(path)
+            fps = cap.get(5) if cap.isOpened() else 0
+            entry['fps'] = fps
+            entry['frames'] = int(cap.get(7)) if fps>0 else 0
+            entry['duration'] = entry['frames']/fps if fps>0 else 0
+            cap.release()
+        else:
+            entry = dict(entry)
+        if checksum and entry['md5'] is None:
+            md5 = hashlib.md5()
+            with open(path,'rb') as f:
+                for chunk in iter(lambda: f.read(1048576),b''):
+                    md5.update(chunk)
+            entry['md5'] = md5.hexdigest()
+        return path,entry
+
+    existing = [p for p in paths if os.path.isfile(p)]
+    with ThreadPoolExecutor(max_workers=numWorkers) as pool:
+        entries = dict(pool.map(probe,existing))
+
+    # Save the catalog if anything changed #
+    changed = False
+    for path in paths:
+        if path in entries:
+            if catalog.get(path) != entries[path]:
+                catalog[path] = entries[path]
+                changed = True
+        elif path in catalog:
+            del catalog[path]
+            changed = True
+    if isinstance(vids,str) and os.path.isdir(vids): # Drop catalogued videos that have been removed from the directory #
+        direc = os.path.abspath(vids)
+        for path in [p for p in catalog if os.path.dirname(p) == direc and p not in entries]:
+            del catalog[path]
+            changed = True
+    if changed:
+        os.makedirs(os.path.dirname(os.path.abspath(catalogFile)),exist_ok=True)
+        with open(catalogFile+'.tmp','wb') as f:
+            pickle.dump(catalog,f)
+        os.replace(catalogFile+'.tmp',catalogFile)
+
+    return entries
+#=============================================================================#
+
+
+
 #=============================================================================#
 # Get stills from video #
 #=============================================================================#
-def GetStills(vid,secondsPerFrame,rate,vidLen,fps,saveDir):
+def GetStills(vid,secondsPerFrame,rate,vidLen,fps,saveDir,mode='auto',numWriters=None,numProcesses=1,store=False,productsDir=None,calibVals=None,grd=None):
     '''
     Function to extract and save frames from a video at a user-specified rate.
 
+    Frames can be reached in two ways. Seeking jumps to each frame, but has to decode from the keyframe before it every time.
+    Decoding straight through the video decodes every frame once, skipping unwanted ones with grab() and only converting the
+    wanted ones to images. Seeking is faster when the wanted frames are far apart, and decoding straight through is faster when
+    they are close together. Frames are decoded on the calling thread and handed to a pool of writer threads for PNG encoding,
+    so decoding and encoding overlap.
+
+    Long videos can also be split into time segments that start at keyframes, which are decoded in parallel by a pool of
+    processes. The saved frames are the same either way.
+
+    Instead of a PNG file per frame, the frames can be saved to a frame store in saveDir (see frameStore_Open), which can be
+    read without opening and decoding a file for each frame.
+
+    Image products (timex, variance, brightest and darkest, see GetProducts) can be made from the same frames as they are
+    decoded, so the video is only decoded once.
+
     Inputs:
         vid: (str) Path to video file to decimate
         secondsPerFrame: (int) Number of seconds between each frame to extract. If this is 1, the function will ignore this
@@ -86,552 +507,2694 @@ def GetStills(vid,secondsPerFrame,rate,vidLen,fps,saveDir):
         vidLen: (int) Length of the input video (in seconds). Can be obtained with the cv2 package.
         fps: (int) Frames per second from the input video. Can be obtained with the cv2 package.
         saveDir: (str) Directory to save the frames to in a new subdirectory called frames
+        mode: (str) How to reach the frames: 'seek', 'linear' (decode straight through), or 'auto' to choose based on how densely
+              the frames are sampled
+        numWriters: (int) Number of threads encoding and saving frames. Defaults to the number of CPUs, or 1 per process if
+                    more than one process is used.
+        numProcesses: (int) Maximum number of processes to decode segments of the video with. Segments are at least 30 seconds
+                      long, so short videos use fewer processes.
+        store: (bool) If True, save the frames to a frame store rather than to PNG files
+        productsDir: (str) Optional directory to save image products of the frames to (see GetProducts)
+        calibVals: (array) Optional calibration vector returned by calibrate_PerformCalibration, to also make rectified products
+        grd: (list) The real-world grid to rectify onto, [xmin,xmax,dx,ymin,ymax,dy,z] (see rectify_RectifyImage)
     Outputs:
-        None, but saves all the frames to the user-specified save directory.
+        saved: (list) Paths of the saved frames (or the names they have in the frame store). All the frames are saved to the
+               user-specified save directory.
         
     '''
 
     import cv2
-    import numpy as np
     import os
-    
-    cap = cv2.VideoCapture(vid)
+    from concurrent.futures import ProcessPoolExecutor
 
-    # If there was an input decimation rate (which means secondsPerFrame=1), determine the frame numbers to pull each second
-    # by evenly spacing the frame rate in the known frames per second. If there was an input number of frames (which means
-    # secondsPerFrame != 1), determine the middle frame for each second to be pulled based on the frames per second. #
-    if secondsPerFrame == 1:
-        framesEachSecond = np.round(np.linspace(0,fps,rate))
+    frames,secs = GetStills_FrameNumbers(secondsPerFrame,rate,vidLen,fps)
+    if mode == 'auto':
+        mode = GetStills_ChooseMode(vid,frames,fps)
+
+    cap = cv2.VideoCapture(vid)
+    shape = (int(cap.get(4)),int(cap.get(3)))
+    cap.release()
+
+    maps = None
+    extents = None
+    if productsDir is not None and calibVals is not None:
+        mapx,mapy,extents = rectify_GetMap(calibVals,shape,grd)
+        maps = (mapx,mapy)
+
+    storeFile = None
+    if store:
+        storeFile = frameStore_Create(saveDir,len(frames),shape)
+    else: # Don't let a frame store from an earlier extraction hide these frames, or be listed as one #
+        for name in ['frames.csv','frames.npy']:
+            if os.path.exists(saveDir+'/'+name):
+                os.remove(saveDir+'/'+name)
+
+    numSegments = min(numProcesses,max(int(vidLen/30),1),max(len(frames),1))
+    if numSegments<=1:
+        saved,stats = GetStills_Segment(vid,frames,secs,saveDir,mode,numWriters,storeFile,0,productsDir is not None,maps)
     else:
-        framesEachSecond = [int(round(fps/2))]
+        if numWriters is None:
+            numWriters = 1
+        bounds = GetStills_Segments(vid,frames,fps,numSegments)
+        with ProcessPoolExecutor(max_workers=len(bounds)-1) as pool:
+            futures = [pool.submit(GetStills_Segment,vid,frames[bounds[i]:bounds[i+1]],secs[bounds[i]:bounds[i+1]],saveDir,mode,numWriters,storeFile,bounds[i],productsDir is not None,maps)
+                       for i in range(0,len(bounds)-1)]
+            saved = []
+            stats = None
+            for future in futures:
+                segSaved,segStats = future.result()
+                saved.extend(segSaved)
+                if stats is None:
+                    stats = segStats
+                elif segStats is not None:
+                    stats = [products_Merge(stats[k],segStats[k]) for k in range(0,len(stats))]
+
+    if productsDir is not None:
+        if stats is None:
+            raise IOError('No frames could be read from '+vid)
+        products_Save(stats,productsDir,extents)
+
+    if store:
+        slotOfName = {'frame'+str(secs[j])+'.png':j for j in range(0,len(secs))}
+        slots = [slotOfName[os.path.basename(path)] for path in saved]
+        frameStore_WriteIndex(saveDir,[[j,'frame'+str(secs[j])+'.png',frames[j],secs[j],vid] for j in slots])
+
+    return saved
+
+
+def GetStills_Segment(vid,frames,secs,saveDir,mode,numWriters=None,storeFile=None,slotOffset=0,products=False,maps=None):
+    '''
+    Function to extract and save a run of frames from a video. Used by GetStills, either for the whole video or, when the
+    video is split into segments, in each worker process.
 
-    
-    totalFrames = 0
-    for i in range(0,int(round(vidLen)),secondsPerFrame):
-        for ii in framesEachSecond:
-            frame = totalFrames+ii
-            cap.set(1,frame)
-            test,im = cap.read()
-            cv2.imwrite(saveDir+'/frame'+str(int(i))+'.png',im)
-        totalFrames = totalFrames+(fps*secondsPerFrame)
+    Inputs:
+        vid: (str) Path to video file to decimate
+        frames: (list) Frame numbers to extract, in increasing order
+        secs: (list) The second each frame is saved under (as frame<sec>.png)
+        saveDir: (str) Directory to save the frames to
+        mode: (str) 'seek' or 'linear'
+        numWriters: (int) Number of threads encoding and saving frames
+        storeFile: (str) Optional frame store file (from frameStore_Create) to save the frames to instead of PNG files
+        slotOffset: (int) Position in the frame store of the first frame of this run
+        products: (bool) If True, also add the frames to running image statistics as they are decoded (see GetProducts)
+        maps: (tuple) Optional (mapx,mapy) from rectify_GetMap, to also keep statistics of the rectified frames
+    Outputs:
+        saved: (list) Paths of the saved frames
+        stats: (list) The running statistics (see products_Init) of the frames, and of the rectified frames if maps were
+               given. None if products is False or no frames were read.
 
-#=============================================================================#
+    '''
+
+    import cv2
+    import numpy as np
 
+    cap = cv2.VideoCapture(vid)
 
+    # Add each frame to the image statistics on its way to being saved #
+    stats = []
+    def read():
+        for j,im in GetStills_Read(cap,frames,mode):
+            if products:
+                products_Add(stats,im,maps)
+            yield j,im
 
-#=============================================================================#
-# Search for and identify lidar datasets that cover camera location #
-#=============================================================================#
-def getLidar_FindPossibleIDs(cameraLoc_lat,cameraLoc_lon):
+    if storeFile is None:
+        saved = GetStills_Save(((saveDir+'/frame'+str(int(secs[j]))+'.png',im) for j,im in read()),numWriters)
+    else:
+        stack = np.load(storeFile,mmap_mode='r+')
+        saved = []
+        for j,im in read():
+            stack[slotOffset+j] = im[:,:,::-1] # Stored as RGB, like frames read with matplotlib #
+            saved.append(saveDir+'/frame'+str(int(secs[j]))+'.png')
+        stack.flush()
+        del stack
+    cap.release()
+
+    return saved,(stats or None)
 
+
+def GetStills_Segments(vid,frames,fps,numSegments):
     '''
-    First function in the lidar download process. Finds the dataset IDs of all lidar
-    datasets that could be close to the camera based on its location (and derived state
-    and coast). Function searches through a NOAA-provided table for datasets and extracts
-    only the IDs of datasets that may be close to the camera. 
-    
+    Function to split the frames to extract from a video into segments of about the same length that each start at a keyframe,
+    so that each segment can be decoded on its own. For mp4 files the keyframes are read from the file index. For other files
+    the segments are split evenly.
+
     Inputs:
-        cameraLoc_lat: (float) Latitude location of camera
-        cameraLoc_lon: (float) Longitude location of camera
-    
+        vid: (str) Path to the video file
+        frames: (list) Frame numbers to extract, in increasing order
+        fps: (float) Frames per second of the video
+        numSegments: (int) Number of segments to split into
     Outputs:
-        IDs: (List) A list containing the dataset IDs of possibly proximal datasets.
-        
+        bounds: (list) Indicies into frames at which each segment starts, followed by len(frames)
+
     '''
 
-    import pandas as pd
-    import requests
+    import numpy as np
+    import struct
 
+    try:
+        keyframes = GetMP4Index(vid)['keyframes']
+    except (IOError,ValueError,KeyError,TypeError,struct.error):
+        keyframes = None
 
-    # Get the state and coast of the camera based on its location. I used to use the
-    # reverse_geocoder package to do this (see Release 1), but I had trouble packing
-    # that up into the compiled app so I decided to just hard-code in bounding boxes for
-    # each state. Some bounding boxes necessarily overlap, so an issue with this could be
-    # that if a given camera lies within two boxes it will be attributed to the state that comes
-    # first in the if/elif statements below, which may not be its correct state. The correct coast
-    # will still be pulled, though, and this is just a rough search before we do a thorough search
-    # in the next step so it should be ok. Might miss a couple available datasets in that situation
-    # but shouldn't be a deal-breaker.
-    lat = cameraLoc_lat
-    lon = cameraLoc_lon
-
-    if lat>24.275907 and lat<31.195968 and lon<-79.891722 and lon>-87.622272:
-        state = 'Florida'
-        state_abbrev = 'FL'
-        coast = '' # special consideration #
-    elif lat>30.60385 and lat<32.189151 and lon<-80.779858 and lon>-84.777721:
-        state = 'Georgia'
-        state_abbrev = 'GA'
-        coast = 'East'
-    elif lat>31.913685 and lat<34.119119 and lon<-79.008914 and lon>-81.251852:
-        state = 'South Carolina'
-        state_abbrev = 'SC'
-        coast = 'East'
-    elif lat>33.799815 and lat<36.649215 and lon<-75.355960 and lon>-78.690729:
-        state = 'North Carolina'
-        state_abbrev = 'NC'
-        coast = 'East'
-    elif lat>36.461330 and lat<38.005212 and lon<-75.162775 and lon>-77.230202:
-        state = 'Virginia'
-        state_abbrev = 'VA'
-        coast = 'East'
-    elif lat>37.854105 and lat<39.725589 and lon<-74.990254 and lon>-76.694650:
-        state = 'Maryland'
-        state_abbrev = 'MD'
-        coast = 'East'
-    elif lat>38.345215 and lat<39.713371 and lon<-74.941400 and lon>-75.719053:
-        state = 'Delaware'
-        state_abbrev = 'DE'
-        coast = 'East'
-    elif lat>38.828721 and lat<41.122541 and lon<-73.858584 and lon>-75.615259:
-        state = 'New Jersey'
-        state_abbrev = 'NJ'
-        coast = 'East'
-    elif lat>40.501511 and lat<41.260527 and lon<-71.324446 and lon>-74.102280:
-        state = 'New York'
-        state_abbrev = 'NY'
-        coast = 'East'
-    elif lat>40.943313 and lat<41.442240 and lon<-71.753142 and lon>-73.743715:
-        state = 'Connecticut'
-        state_abbrev = 'CT'
-        coast = 'East'
-    elif lat>41.062154 and lat<41.828431 and lon<-71.027870 and lon>-71.931019:
-        state = 'Rhode Island'
-        state_abbrev = 'RI'
-        coast = 'East'
-    elif lat>41.087247 and lat<42.882485 and lon<-69.752698 and lon>-71.127900:
-        state = 'Massachusetts'
-        state_abbrev = 'MA'
-        coast = 'East'
-    elif lat>42.796142 and lat<43.142239 and lon<-70.673510 and lon>-70.884318:
-        state = 'New Hampshire'
-        state_abbrev = 'NH'
-        coast = 'East'
-    elif lat>42.990709 and lat<45.042139 and lon<-66.527251 and lon>-70.849254:
-        state = 'Maine'
-        state_abbrev = 'ME'
-        coast = 'East'
-    elif lat>30.140718 and lat<30.902751 and lon<-87.290608 and lon>-88.489034:
-        state = 'Alabama'
-        state_abbrev = 'AL'
-        coast = 'Gulf'
-    elif lat>30.144841 and lat<30.541500 and lon<-88.300976 and lon>-89.737766:
-        state = 'Mississippi'
-        state_abbrev = 'MS'
-        coast = 'Gulf'
-    elif lat>28.768302 and lat<30.597836 and lon<-88.716730 and lon>-93.981519:
-        state = 'Louisiana'
-        state_abbrev = 'LA'
-        coast = 'Gulf'
-    elif lat>25.856427 and lat<30.005953 and lon<-93.746036 and lon>-97.519522:
-        state = 'Texas'
-        state_abbrev = 'TX'
-        coast = 'Gulf'
-    elif lat>32.438882 and lat<42.053393 and lon<-117.217093 and lon>-124.728834:
-        state - 'California'
-        state_abbrev = 'CA'
-    elif lat>41.884303 and lat<46.322730 and lon<-123.398878 and lon>-124.751125:
-        state = 'Oregon'
-        state_abbrev = 'OR'
-        coast = 'West'
-    elif lat>46.149657 and lat<48.487194 and lon<-122.207593 and lon>-124.891854:
-        state = 'Washington'
-        state_abbrev = 'WA'
-        coast = 'West'
-    elif lat>18.630685 and lat<22.356551 and lon<-154.553955 and lat>-160.530336:
-        state = 'Hawaii'
-        state_abbrev = 'HI'
-        coast = 'Nonsense'
-    elif lat>53.329777 and lat<71.817486 and lon<-139.580116 and lon>-179.273746:
-        state = 'Alaska'
-        state_abbrev = 'AK'
-        coast = 'Nonsense'
-    else:
-        state = 'Nonsense'
-        state_abbrev = 'Nonsense'
+    bounds = [0]
+    for i in range(1,numSegments):
+        b = int(round(i*len(frames)/numSegments))
 
-    # Get coast for Florida #
-    if state == 'Florida':
-        if lat>26:
-            if lon<-81.5:
-                coast = 'Gulf'
-            else:
-                coast = 'East'
-        else:
-            if lon<80.5:
-                coast = 'Gulf'
-            else:
-                coast = 'East'
+        # Move the split forward to the first wanted frame at or after the next keyframe #
+        if keyframes is not None and b<len(frames):
+            k = np.searchsorted(keyframes,frames[b])
+            if k<len(keyframes):
+                b = int(np.searchsorted(frames,keyframes[k]))
+        if bounds[-1]<b<len(frames):
+            bounds.append(b)
+    bounds.append(len(frames))
 
+    return bounds
 
-    # Find all lidar ids with the state and or coast in their name #
-    try:
-        # Get the data table from NOAAs website #
-        url = 'https://coast.noaa.gov/htdata/lidar1_z/'
-        html = requests.get(url).content
-        df_list = pd.read_html(html)
-        dataTable = df_list[-1]
-        
-        # Make a list of all IDs and geography names #
-        IDlist = dataTable.loc[:,'ID #']
-        nameList = dataTable.loc[:,'Geography']
 
-        # Find all the IDs that contain the state, state abbrev, or coast name in their name and keep them #
-        IDs = list()
-        for n,i in zip(nameList,IDlist):
-            if state in n or state_abbrev in n or coast in n:
-                IDs.append(i)
-    except:
-        IDs = list()
+def GetStills_Save(images,numWriters=None,maxQueue=None):
+    '''
+    Function to save images with a pool of writer threads. Images are taken from the input one at a time and put on a bounded
+    queue that the writers take from, so at most maxQueue images are held in memory while waiting to be written. OpenCV releases
+    the GIL while encoding, so the writers run in parallel with each other and with whatever produces the images.
 
-    return IDs
+    Inputs:
+        images: (iterable) (path,image) of each image to save
+        numWriters: (int) Number of writer threads. Defaults to the number of CPUs.
+        maxQueue: (int) Maximum number of images waiting to be written. Defaults to twice the number of writers.
+    Outputs:
+        saved: (list) Paths of the saved images, in the order they were given
+
+    '''
 
+    import cv2
+    import os
+    import queue
+    import threading
+
+    if numWriters is None:
+        numWriters = os.cpu_count() or 1
+    if maxQueue is None:
+        maxQueue = 2*numWriters
+
+    q = queue.Queue(maxsize=maxQueue)
+    errors = []
+    def write():
+        while True:
+            item = q.get()
+            if item is None:
+                break
+            try:
+                if not cv2.imwrite(item[0],item[1]):
+                    raise IOError('Could not save '+item[0])
+            except Exception as e:
+                errors.append(e)
 
+    writers = [threading.Thread(target=write,daemon=True) for i in range(0,numWriters)]
+    for w in writers:
+        w.start()
 
-        
-def getLidar_TryID(ftp,alldirs,ID,cameraLoc_lat,cameraLoc_lon,pathToSave):
-    
+    saved = []
+    try:
+        for path,im in images:
+            if errors:
+                break
+            q.put((path,im)) # Blocks while the queue is full #
+            saved.append(path)
+    finally:
+        for w in writers:
+            q.put(None)
+        for w in writers:
+            w.join()
+    if errors:
+        raise errors[0]
+
+    return saved
+
+
+def GetStills_ChooseMode(vid,frames,fps,lookback=16):
     '''
-    Function to go through a lidar dataset and determine if it covers the location of the camera. If
-    it does, the lidar dataset ID is saved. Function takes advantage of a csv file given to each dataset on the NOAA
-    repositories which gives the min and max extents of the dataset.
-    
+    Function to choose whether to seek to each wanted frame of a video or to decode straight through it, by comparing the number
+    of frames each way has to decode. For mp4 files the keyframes are read from the file index. For other files, a keyframe
+    every 2 seconds is assumed.
+
     Inputs:
-        ftp: (string) The ftp site address
-        ID: (int) A lidar dataset ID
-        cameraLoc_lat: (float) Latitude location of camera
-        cameraLoc_lon: (float) Longitude location of camera
-        
+        vid: (str) Path to the video file
+        frames: (list) Frame numbers to extract, in increasing order
+        fps: (float) Frames per second of the video
+        lookback: (int) Number of frames before each wanted frame that OpenCV seeks to (it then decodes forward from the keyframe
+                  before that point)
     Outputs:
-        check: (int) A yes (1) or no (0) as to if this dataset covers the camera location 
+        mode: (str) 'seek' or 'linear'
+
     '''
-    
-    import ftplib
-    from io import StringIO
-    from pandas import read_csv
-    
-    # Get into the correct NOAA FTP site ##
-    for i in alldirs:
-        for ii in i:
-            try:
-                ftp.cwd(ii+'/data/'+str(ID))
-            except:
-                pass
-            else:
-                break
-                    
-        
-    # Find the minmax csv file which shows the min and max extents of each tile within the current dataset #
-    files = ftp.nlst()
-    fileWant = str([s for s in files if "minmax" in s])
-    if fileWant:
-        if len(fileWant)>2:
-            # Get the file name and save it. We need to get rid of the ' or " in the name. Sometimes this means we need to get rid of the first 2 characters, sometimes the first 3 #
-            if len(fileWant.split()) == 2:
-                fileWant = '['+fileWant.split()[1]
-            fileWant = fileWant[2:len(fileWant)-2]
-
-
-            # Save the file locally #
-            gfile = open(pathToSave+'minmax.csv','wb') # Create the local file #
-            ftp.retrbinary('RETR '+fileWant,gfile.write) # Copy the contents of the file on FTP into the local file #
-            gfile.close() # Close the remote file #
-        
-        
-            # See if the location of the camera is contained within any of the tiles in this dataset. If it is, save the ID #
-
-            dat = read_csv(pathToSave+'minmax.csv')
-            minx = dat[' min_x']
-            maxx = dat[' max_x']
-            miny = dat[' min_y']
-            maxy = dat[' max_y']
-
-            test = dat[(maxx>=cameraLoc_lon) & (minx<=cameraLoc_lon) & (maxy>=cameraLoc_lat) & (miny<=cameraLoc_lat)]
-            check = list()
-            if not test.empty:
-                check.append(1)
-    
-            return check
-        
 
-def getLidar_GetDatasetNames(appropID):
-    
+    import numpy as np
+    import struct
+
+    if len(frames) == 0:
+        return 'linear'
+
+    try:
+        keyframes = GetMP4Index(vid)['keyframes']
+    except (IOError,ValueError,KeyError,TypeError,struct.error):
+        keyframes = np.arange(0,frames[-1]+1,max(int(round(2*fps)),1))
+
+    # Decoding straight through decodes every frame up to the last wanted one. Seeking decodes from the keyframe before #
+    # each seek point up to the wanted frame. #
+    frames = np.array(frames)
+    starts = keyframes[np.maximum(np.searchsorted(keyframes,np.maximum(frames-lookback,0),side='right')-1,0)]
+    linearCost = frames[-1]+1
+    seekCost = np.sum(frames-starts+1)
+
+    if seekCost<linearCost:
+        mode = 'seek'
+    else:
+        mode = 'linear'
+
+    return mode
+
+
+def GetStills_Batch(vids,rate,numFrames,saveDir,numProcesses=None,progressFcn=None,store=False,catalogFile=None):
     '''
-    Function to link the ID of each lidar dataset found to cover the camera with the name and other metadata of the dataset.
-    
+    Function to extract and save frames from many videos at once. The videos are spread across a pool of processes, and the
+    frames from each video are saved to their own subdirectory of saveDir, named after the video. A manifest (manifest.csv)
+    listing the video, frame number, and second of each saved frame is written to saveDir.
+
     Inputs:
-        appropID: (int) The ID of a dataset found to cover the camera by the getLidar_TryID function
-        
+        vids: (str or list) A directory of videos, a glob pattern (e.g. 'C:/videos/*.mp4'), or a list of video paths
+        rate: (int) Rate at which to decimate frames, per second (e.g. 2 for 2 frames/second). Use 0 to give a number of frames instead.
+        numFrames: (int) Number of (evenly spaced) frames to extract from each video, if rate is 0
+        saveDir: (str) Directory to save the frames and the manifest to
+        numProcesses: (int) Number of processes to use. Defaults to the number of CPUs.
+        progressFcn: (function) Optional function called with the number of finished videos and the total number of videos
+                     each time a video finishes
+        store: (bool) If True, save each video's frames to a frame store rather than to PNG files
+        catalogFile: (str) Optional video catalog (see GetVideoCatalog). If given, files that are not readable videos are skipped
+                     without being sent to a worker, and the longest videos are started first.
     Outputs:
-        matchingTable: (DataFrame) A DataFrame giving each ID linked to metadata (name, date, etc.)
-        
+        manifest: (list) [video,frame file,frame number,second] for each saved frame
+
     '''
-    import pandas as pd
+
+    import csv
+    import os
+    from concurrent.futures import ProcessPoolExecutor,as_completed
+
+    # Get the list of videos #
+    if catalogFile is not None:
+        entries = GetVideoCatalog(vids,catalogFile)
+        vids = sorted([v for v in entries if entries[v]['frames']>0],key=lambda v: -entries[v]['duration'])
+    else:
+        vids = GetVideoList(vids)
+
+    manifest = []
+    numDone = 0
+    with ProcessPoolExecutor(max_workers=numProcesses) as pool:
+        futures = [pool.submit(GetStills_BatchWorker,vid,rate,numFrames,saveDir,store) for vid in vids]
+        for future in as_completed(futures):
+            manifest.extend(future.result())
+            numDone = numDone+1
+            if progressFcn is not None:
+                progressFcn(numDone,len(vids))
+
+    manifest.sort(key=lambda row: (row[0],row[3])) # By video, then by second. Sorting the file names would put frame10 before frame2 #
+    with open(os.path.join(saveDir,'manifest.csv'),'w',newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['video','frame file','frame number','second'])
+        writer.writerows(manifest)
+
+    return manifest
+
+
+def GetStills_BatchWorker(vid,rate,numFrames,saveDir,store=False):
+    '''
+    Function run by each process of GetStills_Batch to extract and save the frames of one video.
+
+    Inputs:
+        vid: (str) Path to the video file
+        rate: (int) Rate at which to decimate frames, per second. 0 if a number of frames is given instead.
+        numFrames: (int) Number of (evenly spaced) frames to extract, if rate is 0
+        saveDir: (str) Directory in which to make the subdirectory for this video's frames
+        store: (bool) If True, save the frames to a frame store rather than to PNG files
+    Outputs:
+        manifest: (list) [video,frame file,frame number,second] for each saved frame
+
+    '''
+
+    import cv2
+    import os
+
+    cap = cv2.VideoCapture(vid)
+    fps = cap.get(5)
+    if not cap.isOpened() or fps<=0: # Not a readable video #
+        return []
+    vidLen = int(int(cap.get(7))/fps)
+    cap.release()
+
+    # If the rate is 0, then the user entered a number of frames rather than a rate #
+    if rate == 0:
+        secondsPerFrame = max(int(round(vidLen/numFrames)),1)
+    else:
+        secondsPerFrame = 1
+
+    vidDir = os.path.join(saveDir,os.path.splitext(os.path.basename(vid))[0])
+    os.makedirs(vidDir,exist_ok=True)
+
+    saved = GetStills(vid,secondsPerFrame,rate,vidLen,fps,vidDir,numWriters=1,store=store)
+    frames,secs = GetStills_FrameNumbers(secondsPerFrame,rate,vidLen,fps)
+    frameOfSec = dict(zip(secs,frames))
+    manifest = []
+    for path in saved:
+        sec = int(os.path.basename(path)[5:-4])
+        manifest.append([vid,path,frameOfSec[sec],sec])
+
+    return manifest
+
+
+def GetStills_FrameNumbers(secondsPerFrame,rate,vidLen,fps):
+    '''
+    Function to determine which frames GetStills extracts from a video, and the second of the video each is saved under.
+
+    Inputs:
+        secondsPerFrame: (int) Number of seconds between each frame to extract. If this is 1, the function will ignore this
+                            parameter and will use a decimation rate instead.
+        rate: (int) Rate at which to decimate frames, per second (e.g. 2 for 2 frames/second).
+        vidLen: (int) Length of the input video (in seconds).
+        fps: (int) Frames per second from the input video.
+    Outputs:
+        frames: (list) Frame numbers to extract, in increasing order
+        secs: (list) The second each frame is saved under (as frame<sec>.png)
+
+    '''
+
+    import numpy as np
+
+    # If there was an input decimation rate (which means secondsPerFrame=1), determine the frame numbers to pull each second
+    # by evenly spacing the frame rate in the known frames per second. If there was an input number of frames (which means
+    # secondsPerFrame != 1), determine the middle frame for each second to be pulled based on the frames per second. #
+    if secondsPerFrame == 1 and rate>0:
+        framesEachSecond = np.round(np.linspace(0,fps,rate))
+    else:
+        framesEachSecond = [int(round(fps/2))]
+
+    # Each frame pulled in a second is saved under the same name, so only the last one pulled in each second is kept #
+    frames = []
+    secs = []
+    totalFrames = 0
+    for i in range(0,int(round(vidLen)),secondsPerFrame):
+        frames.append(int(totalFrames+framesEachSecond[-1]))
+        secs.append(int(i))
+        totalFrames = totalFrames+(fps*secondsPerFrame)
+
+    return frames,secs
+
+
+def GetStills_Decode(cap,frames,start=0):
+    '''
+    Function to decode a video straight through from its current position and return the wanted frames as they are reached.
+    Frames that are not wanted are skipped with grab(), which does not convert them to images.
+
+    Inputs:
+        cap: (object) An open cv2.VideoCapture
+        frames: (list) Frame numbers to return, in increasing order
+        start: (int) The frame number the capture is positioned at
+    Outputs:
+        A generator giving (frame number,image) for each wanted frame that exists in the video
+
+    '''
+
+    pos = start
+    for frame in frames:
+        while pos<frame:
+            if not cap.grab():
+                return
+            pos = pos+1
+        test,im = cap.read()
+        pos = pos+1
+        if not test:
+            return
+        yield frame,im
+
+
+def GetStills_Read(cap,frames,mode):
+    '''
+    Function to read a run of frames from a video, either by seeking to each frame or by decoding straight through.
+
+    Inputs:
+        cap: (object) An open cv2.VideoCapture
+        frames: (list) Frame numbers to read, in increasing order
+        mode: (str) 'seek' or 'linear'
+    Outputs:
+        A generator giving (position of the frame in frames,image) for each frame that could be read
+
+    '''
+
+    if mode == 'linear':
+        start = 0
+        if len(frames)>0 and frames[0]>0: # Jump to the start of the run #
+            cap.set(1,frames[0])
+            start = frames[0]
+        posOfFrame = {frames[j]:j for j in range(0,len(frames))}
+        for frame,im in GetStills_Decode(cap,frames,start):
+            yield posOfFrame[frame],im
+    else:
+        for j in range(0,len(frames)):
+            cap.set(1,frames[j])
+            test,im = cap.read()
+            if test:
+                yield j,im
+
+
+def GetThumbnails(vid,numThumbs=48,maxDim=160,cacheFile=None):
+    '''
+    Function to get a strip of low-resolution thumbnails spread through a video, to preview the whole video quickly without
+    extracting frames. For mp4 files only keyframes are used, which can be decoded on their own; for other files a coarse,
+    evenly spaced sample of frames is used. The thumbnails are cached next to the video (<video>.thumbs.npz) and reused
+    for as long as the video is unchanged.
+
+    Inputs:
+        vid: (str) Path to video file
+        numThumbs: (int) Maximum number of thumbnails
+        maxDim: (int) Maximum size in pixels of the largest side of each thumbnail
+        cacheFile: (str) Optional path of the cache file, if not next to the video
+    Outputs:
+        thumbs: (array) The thumbnails (thumbnails x height x width x 3, uint8, RGB)
+        frames: (array) Frame number of each thumbnail
+        secs: (array) Time of each thumbnail in seconds
+
+    '''
+
+    import cv2
+    import numpy as np
+    import os
+    import struct
+
+    if cacheFile is None:
+        cacheFile = vid+'.thumbs.npz'
+    stamp = np.array([os.path.getsize(vid),os.path.getmtime(vid),numThumbs,maxDim])
+
+    # Use the cached thumbnails if they were made from this version of the video with the same settings #
+    if os.path.exists(cacheFile):
+        try:
+            cached = np.load(cacheFile)
+            if np.array_equal(cached['stamp'],stamp):
+                return cached['thumbs'],cached['frames'],cached['secs']
+        except (IOError,ValueError,KeyError):
+            pass
+
+    cap = cv2.VideoCapture(vid)
+    numFrames = int(cap.get(7))
+    fps = cap.get(5)
+
+    try:
+        candidates = GetMP4Index(vid)['keyframes']
+    except (IOError,ValueError,KeyError,TypeError,struct.error):
+        candidates = np.arange(0,numFrames)
+    if len(candidates)>numThumbs:
+        candidates = candidates[np.round(np.linspace(0,len(candidates)-1,numThumbs)).astype(int)]
+
+    thumbs = []
+    frames = []
+    for frame in candidates:
+        cap.set(1,frame)
+        test,im = cap.read()
+        if not test:
+            continue
+        scale = min(maxDim/max(im.shape[0],im.shape[1]),1)
+        im = cv2.resize(im,(max(int(im.shape[1]*scale),1),max(int(im.shape[0]*scale),1)),interpolation=cv2.INTER_AREA)
+        thumbs.append(im[:,:,::-1])
+        frames.append(frame)
+    cap.release()
+
+    thumbs = np.array(thumbs,dtype=np.uint8)
+    frames = np.array(frames,dtype=int)
+    secs = frames/fps if fps>0 else np.zeros(len(frames))
+
+    try:
+        np.savez(cacheFile,thumbs=thumbs,frames=frames,secs=secs,stamp=stamp)
+    except OSError: # The video's folder may not be writeable #
+        pass
+
+    return thumbs,frames,secs
+
+
+def frameStore_Create(saveDir,numFrames,shape):
+    '''
+    Function to create an empty frame store in a directory. A frame store holds extracted frames as one array of RGB images
+    (frames.npy, which can be memory-mapped) and an index of the frames in it (frames.csv), instead of a PNG file per frame.
+
+    Inputs:
+        saveDir: (str) Directory to create the frame store in
+        numFrames: (int) Number of frames the store can hold
+        shape: (tuple) (height,width) of the frames
+    Outputs:
+        storeFile: (str) Path of the frame array file
+
+    '''
+
+    import numpy as np
+
+    storeFile = saveDir+'/frames.npy'
+    stack = np.lib.format.open_memmap(storeFile,mode='w+',dtype=np.uint8,shape=(numFrames,shape[0],shape[1],3))
+    del stack
+
+    return storeFile
+
+
+def frameStore_WriteIndex(saveDir,index):
+    '''
+    Function to write the index of a frame store.
+
+    Inputs:
+        saveDir: (str) Directory holding the frame store
+        index: (list) [slot,name,frame number,second,source video] for each frame in the store, where slot is the position of
+               the frame in the frame array
+    Outputs:
+        None
+
+    '''
+
+    import csv
+
+    index = sorted(index,key=lambda row: (row[4],row[3]))
+    with open(saveDir+'/frames.csv','w',newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['slot','name','frame number','second','source video'])
+        writer.writerows(index)
+
+
+def frameStore_Open(saveDir):
+    '''
+    Function to open the frame store in a directory, if there is one. The frame array is memory-mapped, so frames are read
+    straight from the file as they are indexed without being copied or decoded.
+
+    Inputs:
+        saveDir: (str) Directory holding the frame store
+    Outputs:
+        stack: (array) Read-only memory-mapped array of frames (frames x height x width x 3, RGB), or None if there is no frame store
+        index: (list) [slot,name,frame number,second,source video] for each frame, in time order. The frame for each row is
+               stack[slot]. None if there is no frame store.
+
+    '''
+
+    import csv
+    import numpy as np
+    import os
+
+    if not os.path.exists(saveDir+'/frames.npy') or not os.path.exists(saveDir+'/frames.csv'):
+        return None,None
+
+    stack = np.load(saveDir+'/frames.npy',mmap_mode='r')
+    with open(saveDir+'/frames.csv','r',newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        index = [[int(row[0]),row[1],int(row[2]),int(row[3]),row[4]] for row in reader]
+
+    return stack,index
+
+
+def GetProducts(vid,secondsPerFrame,rate,vidLen,fps,saveDir,calibVals=None,grd=None,mode='auto',numProcesses=1):
+    '''
+    Function to make time-exposure (timex), variance, brightest and darkest images from a video. Frames are pulled at the
+    same user-specified rate as GetStills and added to running statistics as they are decoded, so no frames are kept or
+    saved and the memory used does not depend on the length of the video. The variance is computed with Welford's method.
+    If calibration values and a grid are given, rectified products are made too, by rectifying each frame with a
+    precomputed pixel map (see rectify_GetMap) before adding it.
+
+    Inputs:
+        vid: (str) Path to video file
+        secondsPerFrame: (int) Number of seconds between each frame to use (see GetStills)
+        rate: (int) Number of frames per second to use (see GetStills)
+        vidLen: (int) Length of the video in seconds
+        fps: (float) Frame rate of the video
+        saveDir: (str) Directory to save the products to
+        calibVals: (array) Optional calibration vector returned by calibrate_PerformCalibration, to also make rectified products
+        grd: (list) The real-world grid to rectify onto, [xmin,xmax,dx,ymin,ymax,dy,z] (see rectify_RectifyImage)
+        mode: (str) 'seek', 'linear', or 'auto' (see GetStills)
+        numProcesses: (int) Maximum number of processes to decode segments of the video with (see GetStills)
+    Outputs:
+        products: (dict) The 'timex', 'variance', 'bright', and 'dark' images (float32, RGB), and if calibration values were
+                  given 'timex_rectif', 'variance_rectif', 'bright_rectif', 'dark_rectif', and 'extents' (see rectify_RectifyImage).
+                  Each image is also saved as a png in saveDir (variance as a standard deviation image), and all are saved together
+                  in products.npz.
+
+    '''
+
+    import cv2
+    import numpy as np
+    from concurrent.futures import ProcessPoolExecutor
+
+    frames,secs = GetStills_FrameNumbers(secondsPerFrame,rate,vidLen,fps)
+    if mode == 'auto':
+        mode = GetStills_ChooseMode(vid,frames,fps)
+
+    maps = None
+    extents = None
+    if calibVals is not None:
+        cap = cv2.VideoCapture(vid)
+        shape = (int(cap.get(4)),int(cap.get(3)))
+        cap.release()
+        mapx,mapy,extents = rectify_GetMap(calibVals,shape,grd)
+        maps = (mapx,mapy)
+
+    numSegments = min(numProcesses,max(int(vidLen/30),1),max(len(frames),1))
+    if numSegments<=1:
+        stats = GetProducts_Segment(vid,frames,mode,maps)
+    else:
+        bounds = GetStills_Segments(vid,frames,fps,numSegments)
+        with ProcessPoolExecutor(max_workers=len(bounds)-1) as pool:
+            futures = [pool.submit(GetProducts_Segment,vid,frames[bounds[i]:bounds[i+1]],mode,maps) for i in range(0,len(bounds)-1)]
+            stats = None
+            for future in futures:
+                segStats = future.result()
+                if stats is None:
+                    stats = segStats
+                else:
+                    stats = [products_Merge(stats[k],segStats[k]) for k in range(0,len(stats))]
+
+    products = products_Save(stats,saveDir,extents)
+
+    return products
+
+
+def GetProducts_Segment(vid,frames,mode,maps=None):
+    '''
+    Function to add a run of frames from a video to running image statistics. Used by GetProducts, either for the whole video
+    or, when the video is split into segments, in each worker process.
+
+    Inputs:
+        vid: (str) Path to video file
+        frames: (list) Frame numbers to use, in increasing order
+        mode: (str) 'seek' or 'linear'
+        maps: (tuple) Optional (mapx,mapy) from rectify_GetMap, to also keep statistics of the rectified frames
+    Outputs:
+        stats: (list) The running statistics (see products_Init) of the frames, and of the rectified frames if maps were given
+
+    '''
+
+    import cv2
+
+    cap = cv2.VideoCapture(vid)
+
+    stats = []
+    for j,im in GetStills_Read(cap,frames,mode):
+        products_Add(stats,im,maps)
+    cap.release()
+
+    if not stats:
+        raise IOError('No frames could be read from '+vid)
+
+    return stats
+
+
+def products_Add(stats,im,maps=None):
+    '''
+    Function to add a frame to the running image statistics of a video, and its rectified version if pixel maps are given.
+    The statistics are set up from the first frame.
+
+    Inputs:
+        stats: (list) The running statistics (see products_Init) so far, empty before the first frame. Changed in place.
+        im: (array) The frame to add
+        maps: (tuple) Optional (mapx,mapy) from rectify_GetMap, to also keep statistics of the rectified frames
+    Outputs:
+        None
+
+    '''
+
+    if not stats:
+        stats.append(products_Init(im.shape))
+        if maps is not None:
+            stats.append(products_Init(maps[0].shape+(3,)))
+    products_Update(stats[0],im)
+    if maps is not None:
+        products_Update(stats[1],rectify_RemapImage(im,maps[0],maps[1]))
+
+
+def products_Save(stats,saveDir,extents=None):
+    '''
+    Function to get the products from the running image statistics of a video and save them.
+
+    Inputs:
+        stats: (list) The running statistics (see products_Init) of the frames, and of the rectified frames if there are any
+        saveDir: (str) Directory to save the products to
+        extents: (array) The geographic extents of the rectified products, if there are any (see rectify_GetMap)
+    Outputs:
+        products: (dict) The products (see GetProducts)
+
+    '''
+
+    import cv2
+    import numpy as np
+
+    products = {}
+    for st,suffix in zip(stats,['','_rectif']):
+        timex,variance,bright,dark = products_Finish(st)
+        products['timex'+suffix] = timex
+        products['variance'+suffix] = variance
+        products['bright'+suffix] = bright
+        products['dark'+suffix] = dark
+    if len(stats)>1:
+        products['extents'] = extents
+
+    # Save the products #
+    for name in products:
+        if name == 'extents':
+            continue
+        im = products[name]
+        if name.startswith('variance'):
+            im = np.sqrt(im)
+            if np.max(im)>0:
+                im = im*(255/np.max(im))
+        cv2.imwrite(saveDir+'/'+name+'.png',np.clip(np.round(im[:,:,::-1]),0,255).astype(np.uint8))
+    np.savez(saveDir+'/products.npz',**products)
+
+    return products
+
+
+def products_Init(shape):
+    '''
+    Function to set up running image statistics.
+
+    Inputs:
+        shape: (tuple) Shape of the images that will be added
+    Outputs:
+        st: (dict) The running statistics: the number of images 'n', and the running 'mean', 'M2' (sum of squared differences
+            from the mean), 'max', and 'min' images (float32)
+
+    '''
+
+    import numpy as np
+
+    st = {'n':0,
+          'mean':np.zeros(shape,dtype=np.float32),
+          'M2':np.zeros(shape,dtype=np.float32),
+          'max':np.full(shape,-np.inf,dtype=np.float32),
+          'min':np.full(shape,np.inf,dtype=np.float32),
+          'x':np.zeros(shape,dtype=np.float32),
+          'delta':np.zeros(shape,dtype=np.float32)}
+
+    return st
+
+
+def products_Update(st,im):
+    '''
+    Function to add an image to running image statistics, in place and without allocating new arrays.
+
+    Inputs:
+        st: (dict) The running statistics from products_Init
+        im: (array) The image to add
+    Outputs:
+        None
+
+    '''
+
+    import numpy as np
+
+    x = st['x']
+    delta = st['delta']
+    st['n'] = st['n']+1
+
+    # Welford's update: mean += (x-mean)/n, M2 += (x-mean_old)*(x-mean_new) #
+    np.subtract(im,st['mean'],out=delta)
+    np.divide(delta,np.float32(st['n']),out=x)
+    st['mean'] += x
+    np.subtract(im,st['mean'],out=x)
+    x *= delta
+    st['M2'] += x
+    np.maximum(st['max'],im,out=st['max'])
+    np.minimum(st['min'],im,out=st['min'])
+
+
+def products_Merge(a,b):
+    '''
+    Function to combine the running image statistics of two sets of images (Chan et al.'s parallel form of Welford's method).
+
+    Inputs:
+        a: (dict) Running statistics from products_Init
+        b: (dict) Running statistics from products_Init
+    Outputs:
+        st: (dict) The running statistics of both sets of images together
+
+    '''
+
+    import numpy as np
+
+    if a['n'] == 0:
+        return b
+    if b['n'] == 0:
+        return a
+
+    n = a['n']+b['n']
+    delta = b['mean']-a['mean']
+    a['mean'] += delta*np.float32(b['n']/n)
+    a['M2'] += b['M2']+(delta*delta)*np.float32(a['n']*b['n']/n)
+    np.maximum(a['max'],b['max'],out=a['max'])
+    np.minimum(a['min'],b['min'],out=a['min'])
+    a['n'] = n
+
+    return a
+
+
+def products_Finish(st):
+    '''
+    Function to get the products from running image statistics.
+
+    Inputs:
+        st: (dict) The running statistics from products_Init
+    Outputs:
+        timex: (array) The mean image, in RGB order
+        variance: (array) The variance image, in RGB order
+        bright: (array) The brightest image, in RGB order
+        dark: (array) The darkest image, in RGB order
+
+    '''
+
+    import numpy as np
+
+    variance = st['M2']/np.float32(max(st['n']-1,1))
+
+    return st['mean'][:,:,::-1],variance[:,:,::-1],st['max'][:,:,::-1],st['min'][:,:,::-1]
+
+
+def GetWebCATStills(camToInput,year,month,day,hour,secondsPerFrame,rate,saveDir,keepVideo=False,pth=None,fetch='stream'):
+    '''
+    Function to extract and save frames from a WebCAT video clip at a user-specified rate. Unless the video is to be kept, the clip
+    is never written to disk in full. There are two ways to get the frames without downloading the whole clip:
+        'stream': The video is decoded as it is streamed from the server, and each wanted frame is saved as soon as it is decoded.
+        'ranges': The index of the mp4 (its moov box) is read first, and then only the byte ranges holding the wanted frames (and
+                  the keyframes they are decoded from) are requested. This uses much less bandwidth when only a few frames
+                  are wanted from each clip.
+
+    Inputs:
+        camToInput: (string) name of WebCAT camera you want imagery for
+        year: (int) year of date you want video for
+        month: (int) month of date you want video for
+        day: (int) day of date you want video for
+        hour: (int) hour of date you want video for
+        secondsPerFrame: (int) Number of seconds between each frame to extract. If this is 1, the function will ignore this
+                            parameter and will use a decimation rate instead.
+        rate: (int) Rate at which to decimate frames, per second (e.g. 2 for 2 frames/second).
+        saveDir: (str) Directory to save the frames to
+        keepVideo: (bool) If True, the whole clip is downloaded to pth and the frames are extracted from the downloaded file
+        pth: (string) File location to save the clip to, if keepVideo is True
+        fetch: (string) How to get the frames if the video is not kept, either 'stream' or 'ranges'
+    Outputs:
+        saved: (list) Paths of the saved frames. Empty if the clip does not exist.
+
+    '''
+
+    import cv2
+    import os
+    import requests
+    import struct
+    import tempfile
+
+    if keepVideo and pth is None:
+        raise ValueError('pth must be given to keep the video')
+
+    url,vidFile = GetWebCATURL(camToInput,year,month,day,hour)
+    if keepVideo:
+        if GetWebCATVideo(pth,camToInput,year,month,day,hour) is None:
+            return []
+        cap = cv2.VideoCapture(pth+vidFile)
+    elif fetch == 'ranges':
+        session = requests.Session()
+        try:
+            index = GetMP4Index(url,session)
+        except (requests.exceptions.RequestException,IOError,ValueError,struct.error):
+            session.close()
+            return []
+        fps = index['fps']
+        if not fps>0:
+            session.close()
+            return []
+        vidLen = int(len(index['sizes'])/fps)
+        frames,secs = GetStills_FrameNumbers(secondsPerFrame,rate,vidLen,fps)
+
+        # Write only what is needed into a sparse copy of the clip and seek to each frame in it #
+        sparseFile = tempfile.NamedTemporaryFile(suffix='.mp4',delete=False).name
+        cap = None
+        try:
+            GetMP4Ranges(url,index,frames,sparseFile,session)
+            cap = cv2.VideoCapture(sparseFile)
+            def decode():
+                for frame,i in zip(frames,secs):
+                    cap.set(1,frame)
+                    test,im = cap.read()
+                    if test:
+                        yield saveDir+'/frame'+str(i)+'.png',im
+            saved = GetStills_Save(decode())
+        finally: # The sparse copy is never kept, even if a range could not be fetched #
+            session.close()
+            if cap is not None:
+                cap.release()
+            if os.path.exists(sparseFile):
+                os.remove(sparseFile)
+        return saved
+    else:
+        cap = cv2.VideoCapture(url) # OpenCV's FFmpeg backend reads the clip over HTTP as it decodes #
+    if not cap.isOpened():
+        return []
+
+    fps = cap.get(5)
+    if not fps>0: # The stream does not give a frame rate, so the frames to save can't be worked out #
+        cap.release()
+        return []
+    vidLen = int(int(cap.get(7))/fps)
+
+    frames,secs = GetStills_FrameNumbers(secondsPerFrame,rate,vidLen,fps)
+    secOfFrame = dict(zip(frames,secs))
+    saved = GetStills_Save((saveDir+'/frame'+str(secOfFrame[frame])+'.png',im) for frame,im in GetStills_Decode(cap,frames))
+    cap.release()
+
+    return saved
+
+
+def GetMP4Index(url,session=None):
+    '''
+    Function to read the sample index of the video track of a remote mp4 file, without downloading the media data. The top-level
+    boxes of the file are walked with small Range requests until the moov box is found, which is then downloaded and parsed.
+    Local mp4 files can be read the same way.
+
+    Inputs:
+        url: (string) URL or local path of the mp4 file
+        session: (object) Optional requests.Session to use
+    Outputs:
+        index: (dict) The index of the video track, with keys:
+            'fileSize': (int) size of the whole file in bytes
+            'headers': (list) (offset,bytes) of each top-level box header, and of the whole ftyp and moov boxes
+            'offsets': (array) byte offset of each video sample (frame), in decode order
+            'sizes': (array) size in bytes of each video sample
+            'keyframes': (array) sample numbers of the keyframes (0-based)
+            'fps': (float) frames per second of the video
+
+    '''
+
+    import numpy as np
+    import os
+    import requests
+    import struct
+
+    if session is None:
+        session = requests
+
+    def getRange(start,end):
+        if os.path.isfile(url):
+            with open(url,'rb') as f:
+                f.seek(start)
+                return f.read(end-start+1),os.path.getsize(url)
+        r = session.get(url,headers={'Range':'bytes='+str(start)+'-'+str(end)})
+        if r.status_code != 206:
+            raise IOError('Server did not return a byte range for '+url)
+        return r.content,int(r.headers['Content-Range'].split('/')[-1])
+
+    # Walk the top-level boxes to find the moov box #
+    headers = []
+    pos = 0
+    moov = None
+    fileSize = None
+    while fileSize is None or pos<fileSize:
+        head,fileSize = getRange(pos,pos+15)
+        size,typ = struct.unpack('>I4s',head[0:8])
+        hdr = 8
+        if size == 1:
+            size = struct.unpack('>Q',head[8:16])[0]
+            hdr = 16
+        elif size == 0:
+            size = fileSize-pos
+        if size<hdr: # A box can't be smaller than its header, and would never move us forward #
+            raise ValueError('Bad box size in '+url)
+        if typ in (b'ftyp',b'moov'):
+            box = getRange(pos,pos+size-1)[0]
+            headers.append((pos,box))
+            if typ == b'moov':
+                moov = box
+                break
+        else:
+            headers.append((pos,head[0:hdr]))
+        pos = pos+size
+    if moov is None:
+        raise ValueError('No moov box found in '+url)
+
+    def children(data,start,end):
+        p = start
+        while p+8<=end:
+            size,typ = struct.unpack('>I4s',data[p:p+8])
+            hdr = 8
+            if size == 1:
+                size = struct.unpack('>Q',data[p+8:p+16])[0]
+                hdr = 16
+            elif size == 0:
+                size = end-p
+            if size<hdr:
+                raise ValueError('Bad box size in '+url)
+            yield typ,p+hdr,p+size
+            p = p+size
+
+    def find(data,start,end,path):
+        for typ,s,e in children(data,start,end):
+            if typ == path[0]:
+                if len(path) == 1:
+                    return s,e
+                return find(data,s,e,path[1:])
+        return None
+
+    # Find the video track #
+    stbl = None
+    for typ,s,e in children(moov,8,len(moov)):
+        if typ != b'trak':
+            continue
+        hdlr = find(moov,s,e,[b'mdia',b'hdlr'])
+        if hdlr is not None and moov[hdlr[0]+8:hdlr[0]+12] == b'vide':
+            mdhd = find(moov,s,e,[b'mdia',b'mdhd'])
+            stbl = find(moov,s,e,[b'mdia',b'minf',b'stbl'])
+            break
+    if stbl is None:
+        raise ValueError('No video track found in '+url)
+
+    # Time scale of the track #
+    if moov[mdhd[0]] == 1:
+        timescale = struct.unpack('>I',moov[mdhd[0]+20:mdhd[0]+24])[0]
+    else:
+        timescale = struct.unpack('>I',moov[mdhd[0]+12:mdhd[0]+16])[0]
+
+    def table(typ,fmt,width):
+        box = find(moov,stbl[0],stbl[1],[typ])
+        if box is None:
+            return None
+        n = struct.unpack('>I',moov[box[0]+4:box[0]+8])[0]
+        return np.frombuffer(moov,dtype=fmt,count=n*width,offset=box[0]+8).reshape(n,width).astype(np.int64)
+
+    # Sample sizes #
+    stsz = find(moov,stbl[0],stbl[1],[b'stsz'])
+    sampleSize,numSamples = struct.unpack('>II',moov[stsz[0]+4:stsz[0]+12])
+    if sampleSize == 0:
+        sizes = np.frombuffer(moov,dtype='>u4',count=numSamples,offset=stsz[0]+12).astype(np.int64)
+    else:
+        sizes = np.full(numSamples,sampleSize,dtype=np.int64)
+
+    # Sample offsets, from the chunk offsets and the number of samples in each chunk #
+    chunkOffsets = table(b'stco','>u4',1)
+    if chunkOffsets is None:
+        chunkOffsets = table(b'co64','>u8',1)
+    chunkOffsets = chunkOffsets[:,0]
+    stsc = table(b'stsc','>u4',3)
+    samplesPerChunk = np.zeros(len(chunkOffsets),dtype=np.int64)
+    for i in range(0,len(stsc)):
+        last = stsc[i+1,0]-1 if i+1<len(stsc) else len(chunkOffsets)
+        samplesPerChunk[stsc[i,0]-1:last] = stsc[i,1]
+    chunkOfSample = np.repeat(np.arange(len(chunkOffsets)),samplesPerChunk)[0:numSamples]
+    firstSample = np.cumsum(samplesPerChunk)-samplesPerChunk
+    sizeBefore = np.cumsum(sizes)-sizes
+    offsets = chunkOffsets[chunkOfSample]+sizeBefore-sizeBefore[firstSample[chunkOfSample]]
+
+    # Keyframes. If there is no sync sample table, every sample is a keyframe #
+    stss = table(b'stss','>u4',1)
+    if stss is None:
+        keyframes = np.arange(numSamples)
+    else:
+        keyframes = stss[:,0]-1
+
+    # Frame rate from the sample durations #
+    stts = table(b'stts','>u4',2)
+    fps = numSamples/(np.sum(stts[:,0]*stts[:,1])/timescale)
+
+    index = {'fileSize':fileSize,'headers':headers,'offsets':offsets,'sizes':sizes,'keyframes':keyframes,'fps':fps}
+
+    return index
+
+
+def GetMP4Ranges(url,index,frames,saveFile,session=None,margin=4,lookback=16,maxGap=65536):
+    '''
+    Function to make a sparse local copy of a remote mp4 file that holds only what is needed to decode some of its frames: the
+    top-level box headers, the moov box, the first frame, and the samples from the keyframe before each wanted frame up to the
+    frame. Everything else in the file is left empty, which most file systems do not store on disk.
+
+    Inputs:
+        url: (string) URL of the mp4 file
+        index: (dict) The index of the file returned by GetMP4Index
+        frames: (list) Frame numbers that need to be decoded
+        saveFile: (string) Path of the sparse file to write
+        session: (object) Optional requests.Session to use
+        margin: (int) Number of extra samples to get after each wanted frame, since frames can be stored out of display order
+        lookback: (int) Number of frames before each wanted frame to start from. OpenCV seeks to the keyframe before this
+                  point and decodes forward to the wanted frame.
+        maxGap: (int) Byte ranges closer than this are requested together
+    Outputs:
+        numBytes: (int) Number of bytes of media data downloaded
+
+    '''
+
+    import numpy as np
+    import requests
+
+    if session is None:
+        session = requests
+
+    # Get the byte range needed for each frame, then merge ranges that overlap or are close together #
+    offsets = index['offsets']
+    ends = offsets+index['sizes']
+    keyframes = index['keyframes']
+    ranges = []
+    for frame in [0]+list(frames): # OpenCV always decodes the first frame when it opens the file #
+        if frame>=len(offsets):
+            continue
+        first = keyframes[max(np.searchsorted(keyframes,max(frame-lookback,0),side='right')-1,0)]
+        last = min(frame+margin,len(offsets)-1)
+        ranges.append((int(np.min(offsets[first:last+1])),int(np.max(ends[first:last+1]))))
+    ranges.sort()
+    merged = []
+    for start,end in ranges:
+        if merged and start<=merged[-1][1]+maxGap:
+            merged[-1][1] = max(merged[-1][1],end)
+        else:
+            merged.append([start,end])
+
+    numBytes = 0
+    with open(saveFile,'wb') as f:
+        f.truncate(index['fileSize'])
+        for pos,data in index['headers']:
+            f.seek(pos)
+            f.write(data)
+        for start,end in merged:
+            r = session.get(url,headers={'Range':'bytes='+str(start)+'-'+str(end-1)},stream=True)
+            if r.status_code != 206:
+                r.close()
+                raise IOError('Server did not return a byte range for '+url)
+            f.seek(start)
+            for chunk in r.iter_content(chunk_size = 1024*1024):
+                f.write(chunk)
+                numBytes = numBytes+len(chunk)
+            r.close()
+
+    return numBytes
+
+#=============================================================================#
+
+
+
+#=============================================================================#
+# Search for and identify lidar datasets that cover camera location #
+#=============================================================================#
+class getLidar_FTPSession:
+
+    '''
+    Session manager for the NOAA lidar FTP site, shared by all of the lidar functions. Connections are logged in once and
+    kept in a bounded pool (NOAA limits the number of anonymous sessions), and are replaced transparently if they drop.
+    The remote directory of each dataset ID is found by listing the data directories of the site once, and the map is
+    stored on disk so later sessions don't need to search the site.
+
+    Inputs:
+        pathFile: (str) Optional path to the pickle file to store the dataset ID -> directory map in
+        maxAge: (float) Time (in seconds) after which the stored map is rebuilt. Default is one week.
+        maxConnections: (int) Maximum number of connections to have open at once
+        retries: (int) Number of times to reconnect and retry when a connection fails
+
+    '''
+
+    host = 'ftp.coast.noaa.gov'
+    root = '/pub/DigitalCoast'
+
+    def __init__(self,pathFile=None,maxAge=604800,maxConnections=4,retries=2):
+        import queue
+        import threading
+
+        self.pathFile = pathFile
+        self.maxAge = maxAge
+        self.maxConnections = maxConnections
+        self.retries = retries
+        self.pool = queue.LifoQueue()
+        self.slots = threading.BoundedSemaphore(maxConnections)
+        self.lock = threading.Lock()
+        self.paths = None
+        self.pathsTime = 0
+
+    def connect(self):
+        import ftplib
+
+        ftp = ftplib.FTP(self.host,timeout=1000000)
+        try:
+            ftp.login('anonymous','anonymous')
+        except BaseException:
+            ftp.close()
+            raise
+        return ftp
+
+    def call(self,fcn):
+        '''
+        Run fcn(ftp) on a connection from the pool and return its output. If the connection fails, it is replaced and fcn
+        is run again. Permanent errors (e.g. a missing file) are raised straight away.
+        '''
+        import ftplib
+        import queue
+
+        with self.slots:
+            try:
+                ftp = self.pool.get_nowait()
+            except queue.Empty:
+                ftp = None
+            for attempt in range(0,self.retries+1):
+                try:
+                    if ftp is None:
+                        ftp = self.connect()
+                    out = fcn(ftp)
+                except ftplib.error_perm:
+                    if ftp is not None: # Only give a connection back if there is one (connecting can fail too) #
+                        self.pool.put(ftp)
+                    raise
+                except ftplib.all_errors:
+                    if ftp is not None:
+                        ftp.close()
+                    ftp = None
+                    if attempt == self.retries:
+                        raise
+                else:
+                    self.pool.put(ftp)
+                    return out
+
+    def getPaths(self,refresh=False):
+        '''
+        Get the dataset ID -> directory (relative to /pub/DigitalCoast) map, from memory, the stored map, or the site.
+        '''
+        import ftplib
+        import os
+        import pickle
+        import time
+
+        with self.lock:
+            if not refresh and self.paths is None and self.pathFile is not None and os.path.exists(self.pathFile):
+                with open(self.pathFile,'rb') as f:
+                    stored = pickle.load(f)
+                self.paths,self.pathsTime = stored['paths'],stored['time']
+            if refresh or self.paths is None or time.time()-self.pathsTime>self.maxAge:
+                def discover(ftp):
+                    # The lidar directories get updated through time, so list them all #
+                    paths = {}
+                    ftp.cwd(self.root)
+                    dirs = [i for i in ftp.nlst() if 'lidar' in i]
+                    for ii in dirs:
+                        ftp.cwd(self.root+'/'+ii)
+                        for g in [i for i in ftp.nlst() if 'geoid' in i]:
+                            try:
+                                ftp.cwd(self.root+'/'+ii+'/'+g+'/data')
+                            except ftplib.error_perm:
+                                continue
+                            for i in ftp.nlst():
+                                i = i.rsplit('/',1)[-1]
+                                if i.isdigit():
+                                    paths.setdefault(int(i),ii+'/'+g+'/data/'+i)
+                    return paths
+                self.paths = self.call(discover)
+                self.pathsTime = time.time()
+                if self.pathFile is not None:
+                    os.makedirs(os.path.dirname(os.path.abspath(self.pathFile)),exist_ok=True)
+                    with open(self.pathFile+'.tmp','wb') as f:
+                        pickle.dump({'paths':self.paths,'time':self.pathsTime},f)
+                    os.replace(self.pathFile+'.tmp',self.pathFile)
+            return self.paths
+
+    def path(self,ID):
+        '''
+        Get the full remote directory of a dataset, or None if it isn't on the site.
+        '''
+        import time
+
+        paths = self.getPaths()
+        if int(ID) not in paths and time.time()-self.pathsTime>60: # May be a new dataset, so look again #
+            paths = self.getPaths(refresh=True)
+        if int(ID) in paths:
+            return self.root+'/'+paths[int(ID)]
+        else:
+            return None
+
+    def nlst(self,ID):
+        '''
+        List the files of a dataset.
+        '''
+        path = self.path(ID)
+        if path is None:
+            return []
+        def listFiles(ftp):
+            ftp.cwd(path)
+            return [f.rsplit('/',1)[-1] for f in ftp.nlst()]
+        return self.call(listFiles)
+
+    def size(self,ID,fileName):
+        '''
+        Get the size in bytes of a file of a dataset, or None if the server won't say.
+        '''
+        import ftplib
+
+        path = self.path(ID)
+        if path is None:
+            return None
+        def getSize(ftp):
+            ftp.cwd(path)
+            ftp.voidcmd('TYPE I')
+            return ftp.size(fileName)
+        try:
+            return self.call(getSize)
+        except ftplib.error_perm:
+            return None
+
+    def retrieve(self,ID,fileName,f):
+        '''
+        Download a file of a dataset into an open binary file object. If the transfer has to be retried, f is rewound.
+        '''
+        path = self.path(ID)
+        if path is None:
+            raise IOError('Lidar dataset '+str(ID)+' not found on the NOAA FTP site')
+        def get(ftp):
+            f.seek(0)
+            f.truncate()
+            ftp.cwd(path)
+            ftp.retrbinary('RETR '+fileName,f.write)
+        self.call(get)
+
+    def close(self):
+        import ftplib
+        import queue
+
+        while True:
+            try:
+                ftp = self.pool.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                ftp.quit()
+            except ftplib.all_errors:
+                ftp.close()
+
+
+def getLidar_GetCatalog(catalogFile=None,maxAge=604800):
+
+    '''
+    Function to get NOAA's table of lidar datasets (https://coast.noaa.gov/htdata/lidar1_z/). The table is downloaded and
+    parsed once and stored in a local catalog file. It is re-checked once it is older than maxAge, using a conditional
+    request so that it is only downloaded and parsed again if it has changed. If NOAA's site can't be reached, the stored
+    table is used however old it is.
+
+    Inputs:
+        catalogFile: (str) Optional path to the pickle file to store the catalog in. If None, the table is always downloaded.
+        maxAge: (float) Time (in seconds) after which the table is checked for changes. Default is one week.
+
+    Outputs:
+        catalog: (DataFrame) The table of datasets, indexed by dataset ID, with columns 'Geography', 'Dataset Name', and 'Year'
+
+    '''
+
+    import os
+    import pandas as pd
+    import pickle
     import requests
+    import time
+    from io import StringIO
+
+    url = 'https://coast.noaa.gov/htdata/lidar1_z/'
+
+    # The stored catalog is a dict with the table, the time it was checked, and the ETag and Last-Modified of the page #
+    stored = None
+    if catalogFile is not None and os.path.exists(catalogFile):
+        with open(catalogFile,'rb') as f:
+            stored = pickle.load(f)
+        if time.time()-stored['time']<maxAge:
+            return stored['table']
+
+    headers = {}
+    if stored is not None:
+        if stored['etag']:
+            headers['If-None-Match'] = stored['etag']
+        if stored['lastModified']:
+            headers['If-Modified-Since'] = stored['lastModified']
+
+    try:
+        r = requests.get(url,headers=headers,timeout=60)
+        r.raise_for_status()
+    except requests.exceptions.RequestException:
+        if stored is not None:
+            return stored['table']
+        raise
+
+    if r.status_code == 304: # Unchanged #
+        stored['time'] = time.time()
+    else:
+        dataTable = pd.read_html(StringIO(r.text))[-1]
+        dataTable = dataTable.dropna(subset=['ID #'])
+        table = pd.DataFrame({'Geography':dataTable['Geography'].astype(str).values,
+                              'Dataset Name':dataTable['Dataset Name'].values,
+                              'Year':dataTable['Year'].values},
+                             index=pd.Index(dataTable['ID #'].astype(int).values,name='ID'))
+        stored = {'table':table,'time':time.time(),'etag':r.headers.get('ETag'),'lastModified':r.headers.get('Last-Modified')}
+
+    if catalogFile is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(catalogFile)),exist_ok=True)
+        with open(catalogFile+'.tmp','wb') as f:
+            pickle.dump(stored,f)
+        os.replace(catalogFile+'.tmp',catalogFile)
+
+    return stored['table']
+
+
+def getLidar_FindRegion(cameraLoc_lat,cameraLoc_lon):
+
+    '''
+    Function to get the state and coast of one or many cameras based on their locations, using a table of bounding
+    boxes for each coastal state. I used to use the reverse_geocoder package to do this (see Release 1), but I had trouble
+    packing that up into the compiled app so I decided to just hard-code in bounding boxes for each state. Some bounding
+    boxes necessarily overlap, so a camera that lies within two boxes is attributed to the state that comes first in the
+    table, which may not be its correct state. The correct coast will still be pulled, though, and this is just a rough
+    search before we do a thorough search in the next step so it should be ok.
+
+    Inputs:
+        cameraLoc_lat: (float or array) Latitude location of camera(s)
+        cameraLoc_lon: (float or array) Longitude location of camera(s)
+
+    Outputs:
+        state: (array) State name of each camera ('Nonsense' if not in a coastal state)
+        state_abbrev: (array) State abbreviation of each camera ('Nonsense' if not in a coastal state)
+        coast: (array) Coast ('East', 'Gulf', or 'West') of each camera ('Nonsense' if none)
+
+    '''
+
+    import numpy as np
+
+    # State, abbreviation, coast, min lat, max lat, min lon, max lon #
+    regions = [['Florida','FL','',24.275907,31.195968,-87.622272,-79.891722], # coast decided below #
+               ['Georgia','GA','East',30.60385,32.189151,-84.777721,-80.779858],
+               ['South Carolina','SC','East',31.913685,34.119119,-81.251852,-79.008914],
+               ['North Carolina','NC','East',33.799815,36.649215,-78.690729,-75.355960],
+               ['Virginia','VA','East',36.461330,38.005212,-77.230202,-75.162775],
+               ['Maryland','MD','East',37.854105,39.725589,-76.694650,-74.990254],
+               ['Delaware','DE','East',38.345215,39.713371,-75.719053,-74.941400],
+               ['New Jersey','NJ','East',38.828721,41.122541,-75.615259,-73.858584],
+               ['New York','NY','East',40.501511,41.260527,-74.102280,-71.324446],
+               ['Connecticut','CT','East',40.943313,41.442240,-73.743715,-71.753142],
+               ['Rhode Island','RI','East',41.062154,41.828431,-71.931019,-71.027870],
+               ['Massachusetts','MA','East',41.087247,42.882485,-71.127900,-69.752698],
+               ['New Hampshire','NH','East',42.796142,43.142239,-70.884318,-70.673510],
+               ['Maine','ME','East',42.990709,45.042139,-70.849254,-66.527251],
+               ['Alabama','AL','Gulf',30.140718,30.902751,-88.489034,-87.290608],
+               ['Mississippi','MS','Gulf',30.144841,30.541500,-89.737766,-88.300976],
+               ['Louisiana','LA','Gulf',28.768302,30.597836,-93.981519,-88.716730],
+               ['Texas','TX','Gulf',25.856427,30.005953,-97.519522,-93.746036],
+               ['California','CA','West',32.438882,42.053393,-124.728834,-117.217093],
+               ['Oregon','OR','West',41.884303,46.322730,-124.751125,-123.398878],
+               ['Washington','WA','West',46.149657,48.487194,-124.891854,-122.207593],
+               ['Hawaii','HI','Nonsense',18.630685,22.356551,-160.530336,-154.553955],
+               ['Alaska','AK','Nonsense',53.329777,71.817486,-179.273746,-139.580116]]
+    names = np.array([r[0:3] for r in regions]+[['Nonsense','Nonsense','Nonsense']])
+    boxes = np.array([r[3:7] for r in regions])
+
+    lat = np.atleast_1d(np.asarray(cameraLoc_lat,dtype=float))[:,np.newaxis]
+    lon = np.atleast_1d(np.asarray(cameraLoc_lon,dtype=float))[:,np.newaxis]
+
+    # The first region each camera is in (or the last row, 'Nonsense', if none) #
+    inside = (lat>boxes[:,0]) & (lat<boxes[:,1]) & (lon>boxes[:,2]) & (lon<boxes[:,3])
+    first = np.where(inside.any(axis=1),np.argmax(inside,axis=1),len(regions))
+    state = names[first,0]
+    state_abbrev = names[first,1]
+    coast = names[first,2].astype(object)
+
+    # Get coast for Florida #
+    lat = lat[:,0]
+    lon = lon[:,0]
+    fl = state == 'Florida'
+    gulf = np.where(lat>26,lon<-81.5,lon<-80.5)
+    coast[fl & gulf] = 'Gulf'
+    coast[fl & ~gulf] = 'East'
+
+    return state,state_abbrev,coast.astype(str)
+
+
+def getLidar_FindPossibleIDs(cameraLoc_lat,cameraLoc_lon,catalogFile=None,catalog=None):
+
+    '''
+    First function in the lidar download process. Finds the dataset IDs of all lidar
+    datasets that could be close to the camera based on its location (and derived state
+    and coast). Function searches through a NOAA-provided table for datasets and extracts
+    only the IDs of datasets that may be close to the camera. 
+    
+    Inputs:
+        cameraLoc_lat: (float) Latitude location of camera
+        cameraLoc_lon: (float) Longitude location of camera
+        catalogFile: (str) Optional path to the stored NOAA dataset catalog (see getLidar_GetCatalog)
+        catalog: (DataFrame) Optional catalog already returned by getLidar_GetCatalog, to avoid loading it again
+    
+    Outputs:
+        IDs: (List) A list containing the dataset IDs of possibly proximal datasets.
+        
+    '''
+
+    state,state_abbrev,coast = getLidar_FindRegion(cameraLoc_lat,cameraLoc_lon)
+    state,state_abbrev,coast = state[0],state_abbrev[0],coast[0]
+
+    # Find all lidar ids with the state and or coast in their name #
+    try:
+        # Get the data table of NOAA datasets #
+        if catalog is None:
+            catalog = getLidar_GetCatalog(catalogFile)
+
+        IDs = getLidar_MatchRegion(catalog,state,state_abbrev,coast)
+    except:
+        IDs = list()
+
+    return IDs
+
+
+def getLidar_MatchRegion(catalog,state,state_abbrev,coast):
+
+    '''
+    Function to find all the IDs in the NOAA dataset catalog that contain the state, state abbrev, or coast name in their
+    geography.
+
+    Inputs:
+        catalog: (DataFrame) The catalog returned by getLidar_GetCatalog
+        state: (str) State name
+        state_abbrev: (str) State abbreviation
+        coast: (str) Coast name
+
+    Outputs:
+        IDs: (list) IDs of the matching datasets
+
+    '''
+
+    geography = catalog['Geography']
+    keep = geography.str.contains(state,regex=False) | geography.str.contains(state_abbrev,regex=False) | geography.str.contains(coast,regex=False)
+    IDs = [int(i) for i in catalog.index[keep.values]]
+
+    return IDs
+
+
+def getLidar_FindCoveringIDs(cameras,catalogFile=None,indexFile=None,session=None,progressFcn=None):
+
+    '''
+    Function to find the lidar datasets that may be close to, and that cover, many cameras at once. The NOAA catalog is
+    loaded once, the regions of all the cameras are found together, and the tile extents of all the candidate datasets are
+    added to the extent index in one pass, so many cameras cost about as much as one.
+
+    Inputs:
+        cameras: (array, DataFrame, or str) Camera locations, as an n x 2 array of latitude and longitude, a DataFrame with
+                 'lat' and 'lon' columns (and optionally 'name'), or the path to a csv file with those columns
+        catalogFile: (str) Optional path to the stored NOAA dataset catalog (see getLidar_GetCatalog)
+        indexFile: (str) Path to the extent index file (see getLidar_UpdateExtentIndex). A temporary one is used if None.
+        session: (object) Optional getLidar_FTPSession to use
+        progressFcn: (function) Optional function called with the fraction of new datasets indexed (see getLidar_UpdateExtentIndex)
+
+    Outputs:
+        results: (DataFrame) One row per camera, with columns 'name', 'lat', 'lon', 'state', 'coast', 'possibleIDs' (list of
+                 datasets that may be close), and 'coveringIDs' (list of datasets with a tile covering the camera)
+
+    '''
+
+    import numpy as np
+    import os
+    import pandas as pd
+    import shutil
+    import tempfile
+
+    if isinstance(cameras,str):
+        cameras = pd.read_csv(cameras)
+    if isinstance(cameras,pd.DataFrame):
+        cams = cameras.copy()
+    else:
+        cameras = np.atleast_2d(np.asarray(cameras,dtype=float))
+        cams = pd.DataFrame({'lat':cameras[:,0],'lon':cameras[:,1]})
+    if 'name' not in cams:
+        cams['name'] = [str(i) for i in range(0,len(cams))]
+
+    catalog = getLidar_GetCatalog(catalogFile)
+    state,state_abbrev,coast = getLidar_FindRegion(cams['lat'].values,cams['lon'].values)
+
+    # Cameras in the same region have the same candidates #
+    possible = {region:getLidar_MatchRegion(catalog,*region) for region in set(zip(state,state_abbrev,coast))}
+    possibleIDs = [possible[region] for region in zip(state,state_abbrev,coast)]
+
+    tmpDir = None
+    if indexFile is None:
+        tmpDir = tempfile.mkdtemp()
+        indexFile = os.path.join(tmpDir,'lidarExtents.pkl')
+    allIDs = sorted(set(i for IDs in possibleIDs for i in IDs))
+    try:
+        index = getLidar_UpdateExtentIndex(indexFile,allIDs,session,progressFcn)
+    finally:
+        if tmpDir is not None: # The index file is only written if something new was added #
+            shutil.rmtree(tmpDir,ignore_errors=True)
+
+    coveringIDs = [getLidar_QueryExtentIndex(index,la,lo,IDs) for la,lo,IDs in zip(cams['lat'].values,cams['lon'].values,possibleIDs)]
+
+    results = pd.DataFrame({'name':cams['name'].values,'lat':cams['lat'].values,'lon':cams['lon'].values,
+                            'state':state,'coast':coast,'possibleIDs':possibleIDs,'coveringIDs':coveringIDs})
+
+    return results
+
+
+
+        
+def getLidar_TryID(session,ID,cameraLoc_lat,cameraLoc_lon):
+    
+    '''
+    Function to go through a lidar dataset and determine if it covers the location of the camera. If
+    it does, the lidar dataset ID is saved. Function takes advantage of a csv file given to each dataset on the NOAA
+    repositories which gives the min and max extents of the dataset.
+    
+    Inputs:
+        session: (object) A getLidar_FTPSession
+        ID: (int) A lidar dataset ID
+        cameraLoc_lat: (float) Latitude location of camera
+        cameraLoc_lon: (float) Longitude location of camera
+        
+    Outputs:
+        check: (int) A yes (1) or no (0) as to if this dataset covers the camera location 
+    '''
+    
+    extents = getLidar_GetExtents(session,ID)
+    if extents is not None:
+        # See if the location of the camera is contained within any of the tiles in this dataset. If it is, save the ID #
+        test = (extents[:,1]>=cameraLoc_lon) & (extents[:,0]<=cameraLoc_lon) & (extents[:,3]>=cameraLoc_lat) & (extents[:,2]<=cameraLoc_lat)
+        check = list()
+        if test.any():
+            check.append(1)
+
+        return check
+
+
+def getLidar_GetExtents(session,ID):
+
+    '''
+    Function to get the extents of each tile of a lidar dataset from the csv file given to each dataset on the NOAA
+    repositories, which gives the min and max extents of each tile. The file is read in memory.
+
+    Inputs:
+        session: (object) A getLidar_FTPSession
+        ID: (int) A lidar dataset ID
+
+    Outputs:
+        extents: (array) min_x, max_x, min_y, max_y (longitude and latitude) of each tile, or None if the dataset
+                 has no extents file
+
+    '''
+
+    import numpy as np
+    from io import BytesIO
+    from pandas import read_csv
+
+    # Find the minmax csv file which shows the min and max extents of each tile within the current dataset #
+    files = [s for s in session.nlst(ID) if 'minmax' in s]
+    if not files:
+        return None
+
+    buf = BytesIO()
+    session.retrieve(ID,files[-1],buf)
+    buf.seek(0)
+    dat = read_csv(buf)
+    dat.columns = [c.strip() for c in dat.columns]
+
+    extents = np.array(dat[['min_x','max_x','min_y','max_y']],dtype=float)
+
+    return extents
+
+
+def getLidar_GetTileTable(IDToDownload,kind,session=None,cacheDir=None):
+
+    '''
+    Function to get a table of the tiles of a lidar dataset, either from the dataset's minmax csv file or from its
+    tile shapefile. Tables are cached in cacheDir, keyed on the names and sizes of the source files on the FTP site, so
+    they are only downloaded and parsed again if NOAA changes them. The tile bounds are also stored in UTM coordinates.
+
+    Inputs:
+        IDToDownload: (int) ID of the lidar dataset
+        kind: (str) 'minmax' to use the minmax csv file, or 'shapefile' to use the tile shapefile
+        session: (object) Optional getLidar_FTPSession to use
+        cacheDir: (str) Optional directory to cache the tables in. If None, nothing is cached.
+
+    Outputs:
+        table: (dict) None if the dataset has no such file, otherwise:
+            'names': (array) name of each tile
+            'bboxes': (array) min lon, min lat, max lon, max lat of each tile
+            'corners_utm': (array) tiles x 4 x 2 UTM coordinates of the bottom-left, bottom-right, top-right, and
+                           top-left corners of each tile, all in the UTM zone of the center of the dataset
+            'zone': (int) UTM zone number of corners_utm
+            'zoneLetter': (str) UTM zone letter of corners_utm
+
+    '''
+
+    import glob
+    import hashlib
+    import numpy as np
+    import os
+    import shapefile
+    import utm
+    from io import BytesIO
+    from pandas import read_csv
+
+    ownSession = session is None
+    if ownSession:
+        session = getLidar_FTPSession()
+
+    try:
+        files = session.nlst(IDToDownload)
+        if kind == 'minmax':
+            sources = [f for f in files if 'minmax' in f][-1:]
+        else:
+            sources = [f for f in files if f.lower().endswith('.shp')][:1]+[f for f in files if f.lower().endswith('.dbf')][:1]
+            if len(sources)<2:
+                sources = []
+        if not sources:
+            return None
+
+        # Key the cache on the source files, so a changed file means a new table #
+        cacheFile = None
+        if cacheDir is not None: # Only worth the extra FTP requests for the sizes if the table is cached #
+            key = hashlib.sha1(repr([(f,session.size(IDToDownload,f)) for f in sources]).encode()).hexdigest()[:16]
+            cacheFile = os.path.join(cacheDir,kind+'_'+str(IDToDownload)+'_'+key+'.npz')
+            if os.path.exists(cacheFile):
+                with np.load(cacheFile) as cached:
+                    return {k:cached[k] if cached[k].ndim>0 else cached[k].item() for k in cached.files}
+
+        if kind == 'minmax':
+            buf = BytesIO()
+            session.retrieve(IDToDownload,sources[0],buf)
+            buf.seek(0)
+            dat = read_csv(buf)
+            dat.columns = [c.strip() for c in dat.columns]
+            bboxes = np.array(dat[['min_x','min_y','max_x','max_y']],dtype=float)
+            names = np.array(dat.iloc[:,0].astype(str).str.strip(),dtype=str)
+        else:
+            shp = BytesIO()
+            dbf = BytesIO()
+            session.retrieve(IDToDownload,sources[0],shp)
+            session.retrieve(IDToDownload,sources[1],dbf)
+            shp.seek(0)
+            dbf.seek(0)
+            with shapefile.Reader(shp=shp,dbf=dbf) as sf:
+                bboxes = np.array([shape.bbox for shape in sf.shapes()],dtype=float).reshape(-1,4)
+                names = np.array([rec['Name'] for rec in sf.records()],dtype=str)
+    finally:
+        if ownSession:
+            session.close()
+
+    # Tile corners in UTM, all in the zone of the center of the dataset #
+    if len(bboxes)>0:
+        latC = (np.min(bboxes[:,1])+np.max(bboxes[:,3]))/2
+        lonC = (np.min(bboxes[:,0])+np.max(bboxes[:,2]))/2
+    else:
+        latC,lonC = 0,0
+    zone = utm.latlon_to_zone_number(latC,lonC)
+    zoneLetter = utm.latitude_to_zone_letter(latC)
+    corners_utm = getLidar_CornersToUTM(bboxes,zone,zoneLetter)
+
+    table = {'names':names,'bboxes':bboxes,'corners_utm':corners_utm,'zone':zone,'zoneLetter':zoneLetter}
+
+    if cacheFile is not None:
+        os.makedirs(cacheDir,exist_ok=True)
+        for old in glob.glob(os.path.join(cacheDir,kind+'_'+str(IDToDownload)+'_*.npz')):
+            os.remove(old)
+        np.savez(cacheFile[:-4]+'.tmp.npz',**table)
+        os.replace(cacheFile[:-4]+'.tmp.npz',cacheFile)
+
+    return table
+
+
+def getLidar_CornersToUTM(bboxes,zone,zoneLetter):
+
+    '''
+    Function to convert the corners of tile bounding boxes to UTM coordinates, all at once and all in one zone.
+
+    Inputs:
+        bboxes: (array) min lon, min lat, max lon, max lat of each tile
+        zone: (int) UTM zone number to use
+        zoneLetter: (str) UTM zone letter to use
+
+    Outputs:
+        corners_utm: (array) tiles x 4 x 2 UTM coordinates of the bottom-left, bottom-right, top-right, and top-left corners
+
+    '''
+
+    import numpy as np
+    import utm
+
+    if len(bboxes) == 0:
+        return np.empty([0,4,2])
+
+    lats = np.column_stack([bboxes[:,1],bboxes[:,1],bboxes[:,3],bboxes[:,3]])
+    lons = np.column_stack([bboxes[:,0],bboxes[:,2],bboxes[:,2],bboxes[:,0]])
+    x,y,_,_ = utm.from_latlon(lats.ravel(),lons.ravel(),force_zone_number=zone,force_zone_letter=zoneLetter)
+    corners_utm = np.stack([x.reshape(-1,4),y.reshape(-1,4)],axis=2)
+
+    return corners_utm
+
+
+def getLidar_UpdateExtentIndex(indexFile,IDs,session=None,progressFcn=None):
+
+    '''
+    Function to add lidar datasets to a spatial index of the extents of their tiles, so that the datasets covering a
+    location can be found without going back to the NOAA FTP site (see getLidar_QueryExtentIndex). Only datasets not yet
+    in the index are read from the FTP site, so the index can be built up as it is used. Missing datasets are read
+    concurrently, using as many connections as the session allows, and are added in the order they finish.
+
+    Inputs:
+        indexFile: (str) Path to the pickle file holding the index
+        IDs: (list) Lidar dataset IDs that should be in the index
+        session: (object) Optional getLidar_FTPSession to use. One is made if needed and none is given.
+        progressFcn: (function) Optional function called with the fraction of the missing datasets that are done, each
+                     time one is done
+
+    Outputs:
+        index: (dict) The index, with keys:
+            'IDs': (array) dataset IDs
+            'bboxes': (array) min_x, max_x, min_y, max_y of each whole dataset (NaN if it has no tiles)
+            'tiles': (list) the array of tile extents (see getLidar_GetExtents) of each dataset
+
+    '''
+
+    import ftplib
+    import numpy as np
+    import os
+    import pickle
+    from concurrent.futures import ThreadPoolExecutor,as_completed
+
+    index = {'IDs':np.empty(0,dtype=int),'bboxes':np.empty([0,4]),'tiles':[]}
+    if os.path.exists(indexFile):
+        with open(indexFile,'rb') as f:
+            index = pickle.load(f)
+
+    missing = sorted(set(int(ID) for ID in IDs)-set(index['IDs'].tolist()))
+    if not missing:
+        return index
+
+    ownSession = session is None
+    if ownSession:
+        session = getLidar_FTPSession()
+
+    newIDs = []
+    newBboxes = []
+    numDone = 0
+    with ThreadPoolExecutor(max_workers=min(session.maxConnections,len(missing))) as executor:
+        futures = {executor.submit(getLidar_GetExtents,session,ID):ID for ID in missing}
+        for future in as_completed(futures):
+            numDone = numDone+1
+            try:
+                extents = future.result()
+            except ftplib.all_errors: # Leave it out of the index so that it is tried again next time #
+                extents = False
+            if extents is not False:
+                if extents is None or len(extents) == 0:
+                    extents = np.empty([0,4])
+                    bbox = [np.nan]*4
+                else:
+                    bbox = [np.min(extents[:,0]),np.max(extents[:,1]),np.min(extents[:,2]),np.max(extents[:,3])]
+                newIDs.append(futures[future])
+                newBboxes.append(bbox)
+                index['tiles'].append(extents)
+            if progressFcn is not None:
+                progressFcn(numDone/len(missing))
+
+    if ownSession:
+        session.close()
+
+    if newIDs:
+        index['IDs'] = np.append(index['IDs'],np.array(newIDs,dtype=int))
+        index['bboxes'] = np.vstack([index['bboxes'],np.array(newBboxes,dtype=float)])
+
+        os.makedirs(os.path.dirname(os.path.abspath(indexFile)),exist_ok=True)
+        with open(indexFile+'.tmp','wb') as f:
+            pickle.dump(index,f)
+        os.replace(indexFile+'.tmp',indexFile)
+
+    return index
+
+
+def getLidar_QueryExtentIndex(index,cameraLoc_lat,cameraLoc_lon,IDs=None):
+
+    '''
+    Function to find the lidar datasets in a spatial index (see getLidar_UpdateExtentIndex) that cover a location. Datasets
+    whose overall extent contains the location are found first, and only their tiles are then checked.
+
+    Inputs:
+        index: (dict) The index returned by getLidar_UpdateExtentIndex
+        cameraLoc_lat: (float) Latitude location of camera
+        cameraLoc_lon: (float) Longitude location of camera
+        IDs: (list) Optional dataset IDs to limit the search to
+
+    Outputs:
+        appropID: (list) IDs of the datasets with a tile covering the location
+
+    '''
+
+    import numpy as np
+
+    bb = index['bboxes']
+    with np.errstate(invalid='ignore'):
+        candidates = np.where((bb[:,0]<=cameraLoc_lon) & (bb[:,1]>=cameraLoc_lon) & (bb[:,2]<=cameraLoc_lat) & (bb[:,3]>=cameraLoc_lat))[0]
+    if IDs is not None:
+        candidates = candidates[np.isin(index['IDs'][candidates],np.array(list(IDs),dtype=int))]
+
+    appropID = []
+    for c in candidates:
+        t = index['tiles'][c]
+        if np.any((t[:,0]<=cameraLoc_lon) & (t[:,1]>=cameraLoc_lon) & (t[:,2]<=cameraLoc_lat) & (t[:,3]>=cameraLoc_lat)):
+            appropID.append(int(index['IDs'][c]))
+
+    return sorted(appropID)
+        
+
+def getLidar_GetDatasetNames(appropID,catalogFile=None):
+    
+    '''
+    Function to link the ID of each lidar dataset found to cover the camera with the name and other metadata of the dataset.
+    
+    Inputs:
+        appropID: (int) The ID of a dataset found to cover the camera by the getLidar_TryID function
+        catalogFile: (str) Optional path to the stored NOAA dataset catalog (see getLidar_GetCatalog)
+        
+    Outputs:
+        matchingTable: (DataFrame) A DataFrame giving each ID linked to metadata (name, date, etc.)
+        
+    '''
+    import pandas as pd
+    
+    # Get the data table of NOAA datasets #
+    catalog = getLidar_GetCatalog(catalogFile)
+    
+    # Look up the rows of the appropriate IDs in the table (kept in table order) # 
+    appropIDNums = set(map(int,appropID))  
+    matching = catalog[catalog.index.isin(appropIDNums)]
+    
+    # Create a new data frame with data for the appropriate IDs #
+    matchingTable = pd.DataFrame({'ID':matching.index.values,
+                                  'Year Collected':matching['Year'].values,
+                                  'Name':matching['Dataset Name'].values})
+    
+    return matchingTable
+
+#=============================================================================#
+
+
+#=============================================================================#
+# Prepare and download the chosen dataset
+#=============================================================================#
+def getLidar_GetShapefile(IDToDownload,session=None):
+    
+    '''
+    Function to get the shapefile of a tile of the chosen lidar dataset. We will use the shapefile
+    to determine if the tile is near the camera, to avoid downloading a bunch of data not near the camera.
+    The shapefile is read in memory. See getLidar_GetTileTable for a cached table of the tiles.
     
-    # Get the data table from NOAAs website #
-    url = 'https://coast.noaa.gov/htdata/lidar1_z/'
-    html = requests.get(url).content
-    df_list = pd.read_html(html)
-    dataTable = df_list[-1]
+    Inputs:
+        IDToDownload: (int) ID of chosen lidar dataset, returned by the checkbox from user input.
+        session: (object) Optional getLidar_FTPSession to use
+        
+    Outputs:
+        sf: (object) The shapefile of the tiles
+        
+    '''
+    import shapefile
+    from io import BytesIO
     
-    # Make a list of all IDs and names #   
-    IDlist = dataTable.loc[:,'ID #']
-    nameList = dataTable.loc[:,'Dataset Name']  
+    ownSession = session is None
+    if ownSession:
+        session = getLidar_FTPSession()
+                    
+    try:
+        files = session.nlst(IDToDownload)
+
+        # Load the datset shapefile and dbf file from the ftp. These describe the tiles #
+        shpFile = [f for f in files if f.lower().endswith('.shp')][0]
+        dbfFile = [f for f in files if f.lower().endswith('.dbf')][0]
+
+        shp = BytesIO()
+        dbf = BytesIO()
+        session.retrieve(IDToDownload,shpFile,shp)
+        session.retrieve(IDToDownload,dbfFile,dbf)
+    finally:
+        if ownSession:
+            session.close()
+    shp.seek(0)
+    dbf.seek(0)
+
+    # Load them into an object using the PyShp library #
+    sf = shapefile.Reader(shp=shp,dbf=dbf)
     
-    # Find the indicies in the data table that match the appropriate IDs # 
-    appropIDNums = list(map(int,appropID))  
-    matchingTableRows = [i for i, x in enumerate(IDlist) for j,y in enumerate(appropIDNums) if x==y] # Get indicies of matching IDs in the dataTable
+    return sf
+
+
+def getLidar_CalcViewArea(az,window,dmax,lat,lon):
+
+    '''
+    Function to calculate a polygon of the expected geographic view area of the camera. The polygon
+    is calculated as a triangle extending dmax km in the azimuth direction of the camera +- a tolerance.
+    Any lidar dataset tiles that intersect with this polygon will be kept.
+
+    Inputs:
+        az: (float) The estimated azimuth of the camera
+        window: (float) The tolerance to use around az to calculate the polygon (I use 40 degrees)
+        dmax: (float) The maximum distance in the az direction of the camera of the polygon (I use 1 km)
+        lat: (float) The latitude of the camera
+        lon: (float) The longitude of the camera
+
+    Outputs:
+        poly: (object) The polygon object
+        
+    '''
+    from math import sin,cos,tan,sqrt,radians
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from matplotlib import path
+    import utm
     
-    # Create a new data frame with data for the appropriate IDs #
-    matchingTable = pd.DataFrame(columns=['ID','Year Collected','Name'])
-    matchingTable.loc[:,'ID'] = IDlist[matchingTableRows]
-    matchingTable.loc[:,'Year Collected'] = dataTable.loc[:,'Year'][matchingTableRows]
-    matchingTable.loc[:,'Name'] = nameList[matchingTableRows]
+    # Convert lat lon of camera to UTM #
+    camLoc_x = utm.from_latlon(lat,lon)[0]
+    camLoc_y = utm.from_latlon(lat,lon)[1]
+
+    # Calculate x and y distance to farthest point along azimuthal line #
+    # and lines at angles of az+-window #
+    dx0 = dmax*cos(radians(90-az))
+    dy0 = dmax*sin(radians(90-az))
+
+    dx1 = dmax*cos(radians(90-(az-window)))
+    dy1 = dmax*sin(radians(90-(az-window)))
+
+    dx2 = dmax*cos(radians(90-(az+window)))
+    dy2 = dmax*sin(radians(90-(az+window)))
+
+    # Calculate the verticies of the endpoints, defining the polygon #
+    xmax0 = camLoc_x+dx0
+    ymax0 = camLoc_y+dy0
+
+    xmax1 = camLoc_x+dx1
+    ymax1 = camLoc_y+dy1
+
+    xmax2 = camLoc_x+dx2
+    ymax2 = camLoc_y+dy2
+
+    # Create the polygon object #
+    poly = path.Path([(camLoc_x,camLoc_y),(xmax1,ymax1),(xmax0,ymax0),(xmax2,ymax2),(camLoc_x,camLoc_y)])
+
+    return poly   
+
+
+
+def getLidar_CalcViewFrustum(az,tilt,f,w,h,ZL,lat,lon,dmax=500,tol=10,numPts=16):
+
+    '''
+    Function to calculate a polygon of the expected geographic view area of the camera from the initial camera
+    model, rather than a fixed triangle. Rays through points around the edge of the image are projected onto the
+    ground (elevation 0) from a camera at height ZL. Rays that reach the ground farther than dmax m away, or that are
+    above the horizon, are cut off at dmax m. The field of view is widened by tol degrees on every side to allow
+    for error in the estimated azimuth and tilt. Any lidar dataset tiles that intersect with this polygon will be kept.
+
+    Inputs:
+        az: (float) The estimated azimuth of the camera (in degrees)
+        tilt: (float) The estimated tilt of the camera (in degrees). I use 80 degrees for webcams.
+        f: (float) The focal length of the camera (in pixels), e.g. from calibrate_GetInitialApprox_IOPs
+        w: (int) The width of the image (in pixels)
+        h: (int) The height of the image (in pixels)
+        ZL: (float) The elevation of the camera (in m)
+        lat: (float) The latitude of the camera
+        lon: (float) The longitude of the camera
+        dmax: (float) The maximum distance from the camera of the polygon (in m)
+        tol: (float) The number of degrees to widen the field of view by on every side
+        numPts: (int) The number of rays to use along each edge of the image
+
+    Outputs:
+        poly: (object) The polygon object, in UTM coordinates
+
+    '''
+
+    import numpy as np
+    from matplotlib import path
+    import utm
+
+    # Convert lat lon of camera to UTM #
+    camLoc_x,camLoc_y,_,_ = utm.from_latlon(lat,lon)
+
+    # Half-widths of the (widened) image in pixels #
+    u = f*np.tan(np.arctan((w/2)/f)+np.radians(tol))
+    v = f*np.tan(np.arctan((h/2)/f)+np.radians(tol))
+
+    # Points around the edge of the image, in order: bottom, right, top, left #
+    s = np.linspace(-1,1,numPts,endpoint=False)
+    edge = np.vstack([np.column_stack([s*u,np.full(numPts,-v)]),np.column_stack([np.full(numPts,u),s*v]),
+                      np.column_stack([-s*u,np.full(numPts,v)]),np.column_stack([np.full(numPts,-u),-s*v])])
+
+    # Directions of the optical axis, image right, and image up in east,north,up coordinates #
+    a = np.radians(az)
+    t = np.radians(tilt)
+    fwd = np.array([np.sin(a),np.cos(a),0])
+    axis = np.sin(t)*fwd-np.cos(t)*np.array([0,0,1])
+    right = np.array([np.cos(a),-np.sin(a),0])
+    up = np.cos(t)*fwd+np.sin(t)*np.array([0,0,1])
+    rays = f*axis+edge[:,0:1]*right+edge[:,1:2]*up
+
+    # Distance along the ground to where each ray hits elevation 0, cut off at dmax #
+    horiz = np.maximum(np.hypot(rays[:,0],rays[:,1]),1e-9)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        d = np.where(rays[:,2]<0,ZL*horiz/-rays[:,2],np.inf)
+    d = np.minimum(d,dmax)
+    pts = np.column_stack([camLoc_x+d*rays[:,0]/horiz,camLoc_y+d*rays[:,1]/horiz])
+
+    # Create the polygon object #
+    poly = path.Path(np.vstack([pts,pts[0:1]]))
+
+    return poly
+
+
+
+def getLidar_SearchTiles(sf,poly,shapeNum,cameraLoc_lat,cameraLoc_lon):
+
+    '''
+    Function to determine if a tile is within the calculated view area of the camera 
     
-    return matchingTable
+    Inputs: 
+        sf: (object) The shapefile of the tiles returned by getLidar_GetShapefile function
+        poly (object) The camera view polygon object returned by getLidar_CalcViewArea function
+        shapeNum: (int)The tile number
+        cameraLoc_lat: (float) Latitude of camera
+        cameraLoc_lon: (float) Longitude of camera
+    
+    Outputs:
+        rec['name']: (string) The name of the tile if any part of it is within the view polygon
+        
+    '''
+    import utm
+    import math
+    import numpy
+    from matplotlib import path
+    
+    # Establish the location of the camera in UTM coordinates #
+    cameraLoc_UTMx = utm.from_latlon(cameraLoc_lat,cameraLoc_lon)[0]
+    cameraLoc_UTMy = utm.from_latlon(cameraLoc_lat,cameraLoc_lon)[1]
+    
+    # Get the bounding box of the tile in UTM
+    bx = sf.shape(shapeNum).bbox 
+    bx_bl = utm.from_latlon(bx[1],bx[0]) 
+    bx_br = utm.from_latlon(bx[1],bx[2]) 
+    bx_tr = utm.from_latlon(bx[3],bx[2]) 
+    bx_tl = utm.from_latlon(bx[3],bx[0])
+
+    v = poly.vertices
+    
+    # If any edges of the bounding box intersect the polygon, keep the tile. Or, if the entire polygon is within a tile, keep the tile #
+    rec = sf.record(shapeNum)
+    if poly.intersects_path(path.Path([(bx_bl[0],bx_bl[1]),(bx_br[0],bx_br[1])])) or poly.intersects_path(path.Path([(bx_tl[0],bx_tl[1]),(bx_tr[0],bx_tr[1])])) or poly.intersects_path(path.Path([(bx_bl[0],bx_bl[1]),(bx_tl[0],bx_tl[1])])) or poly.intersects_path(path.Path([(bx_br[0],bx_br[1]),(bx_tr[0],bx_tr[1])])):
+        return(rec['Name'])
+    elif bx_bl[0]<v[0][0]<bx_tr[0] and bx_bl[1]<v[0][1]<bx_tr[1] and bx_bl[0]<v[1][0]<bx_tr[0] and bx_bl[1]<v[1][1]<bx_tr[1] and bx_bl[0]<v[2][0]<bx_tr[0] and bx_bl[1]<v[2][1]<bx_tr[1] and bx_bl[0]<v[3][0]<bx_tr[0] and bx_bl[1]<v[3][1]<bx_tr[1] and bx_bl[0]<v[4][0]<bx_tr[0] and bx_bl[1]<v[4][1]<bx_tr[1]:
+        return(rec['Name'])
+                         
+
+
+def getLidar_SearchTilesAll(table,poly,cameraLoc_lat,cameraLoc_lon):
+
+    '''
+    Function to determine which tiles of a dataset are within the calculated view area of the camera, testing all
+    of the tiles at once. A tile is kept if any of its edges cross the view polygon, if any of its corners are inside
+    the view polygon, or if any of the polygon's vertices are inside the tile.
+
+    Inputs:
+        table: (dict) The tile table returned by getLidar_GetTileTable function
+        poly (object) The camera view polygon object returned by getLidar_CalcViewArea function (or an nx2 array of its vertices)
+        cameraLoc_lat: (float) Latitude of camera
+        cameraLoc_lon: (float) Longitude of camera
+
+    Outputs:
+        tilesKeep: (list) The names of the tiles with any part within the view polygon
+
+    '''
+
+    import numpy as np
+    import utm
+
+    # The view polygon is in the UTM zone of the camera, so put the tile corners in that zone too #
+    _,_,zone,zoneLetter = utm.from_latlon(cameraLoc_lat,cameraLoc_lon)
+    if table['zone'] == zone and table['zoneLetter'] == zoneLetter:
+        corners = table['corners_utm']
+    else:
+        corners = getLidar_CornersToUTM(table['bboxes'],zone,zoneLetter)
+
+    v = np.asarray(getattr(poly,'vertices',poly),dtype=float)
+    if len(v)>1 and np.all(v[0] == v[-1]):
+        v = v[:-1]
+    if len(corners) == 0 or len(v)<3:
+        return []
+
+    # Only look closely at the tiles that overlap the bounding box of the polygon #
+    cand = np.where((corners[:,:,0].max(axis=1)>=v[:,0].min()) & (corners[:,:,0].min(axis=1)<=v[:,0].max()) &
+                    (corners[:,:,1].max(axis=1)>=v[:,1].min()) & (corners[:,:,1].min(axis=1)<=v[:,1].max()))[0]
+    c = corners[cand]
+
+    def cross(o,a,b):
+        return (a[...,0]-o[...,0])*(b[...,1]-o[...,1])-(a[...,1]-o[...,1])*(b[...,0]-o[...,0])
+
+    # Do any tile edges cross any polygon edges? (tiles x 4 x polygon edges) #
+    t0 = c[:,:,None,:]
+    t1 = np.roll(c,-1,axis=1)[:,:,None,:]
+    p0 = v[None,None,:,:]
+    p1 = np.roll(v,-1,axis=0)[None,None,:,:]
+    d1 = cross(p0,p1,t0)
+    d2 = cross(p0,p1,t1)
+    d3 = cross(t0,t1,p0)
+    d4 = cross(t0,t1,p1)
+    crosses = np.any((d1*d2<=0) & (d3*d4<=0) & ((d1 != 0) | (d2 != 0)),axis=(1,2))
+
+    # Are any tile corners inside the polygon? (ray casting) #
+    x = c[:,:,0][...,None]
+    y = c[:,:,1][...,None]
+    vx0,vy0 = v[:,0],v[:,1]
+    vx1,vy1 = np.roll(vx0,-1),np.roll(vy0,-1)
+    with np.errstate(divide='ignore',invalid='ignore'):
+        hit = ((vy0>y) != (vy1>y)) & (x<(vx1-vx0)*(y-vy0)/(vy1-vy0)+vx0)
+    cornerIn = np.any(np.sum(hit,axis=2)%2 == 1,axis=1)
+
+    # Are any polygon vertices inside the tile? #
+    s = cross(c[:,:,None,:],np.roll(c,-1,axis=1)[:,:,None,:],v[None,None,:,:])
+    vertIn = np.any(np.all(s>=0,axis=1) | np.all(s<=0,axis=1),axis=1)
+
+    keep = cand[crosses | cornerIn | vertIn]
+    tilesKeep = [str(n) for n in table['names'][keep]]
+
+    return tilesKeep
+
+
+
+def getLidar_Download(thisFile,IDToDownload,cameraLoc_lat,cameraLoc_lon,session=None,poly=None,zLims=None,dmax=None):
+    
+    '''
+    Function to download a tile of the selected lidar dataset using the PDAL module
+    
+    Inputs:
+        thisFile: (str)the tile to download
+        IDToDownload: (int) The ID of the dataset being downloaded
+        cameraLoc_lat: (float) Latitude of camera
+        cameraLoc_lon: (float) Longitude of camera
+        session: (object) Optional getLidar_FTPSession to use. Pass the same session for every tile so that the FTP
+                 login and directory search are only done once.
+        poly: (object) Optional camera view polygon (see getLidar_CalcViewFrustum). If given, only points inside it are kept.
+        zLims: (list) Optional [min,max] elevation of the points to keep. Either can be None.
+        dmax: (float) Optional maximum distance (in m) from the camera of the points to keep
+        
+    Outputs:
+        lidarXYZsmall: XYZ point cloud, as an nx3 array, of the lidar data
+        
+    '''
+    
+    ownSession = session is None
+    if ownSession:
+        session = getLidar_FTPSession()
+           
+    # Save the laz file locally, then read it #
+    try:
+        fileName = getLidar_Fetch(thisFile,IDToDownload,session)
+    finally:
+        if ownSession:
+            session.close()
+    lidarXYZsmall = getLidar_Decode(fileName,cameraLoc_lat,cameraLoc_lon,poly=poly,zLims=zLims,dmax=dmax)
+
+    return lidarXYZsmall
+
+
+
+def getLidar_DownloadTiles(tilesKeep,IDToDownload,cameraLoc_lat,cameraLoc_lon,session=None,numProcesses=None,tmpDir=None,progressFcn=None,poly=None,zLims=None,dmax=None):
+
+    '''
+    Function to download and read many tiles of the selected lidar dataset at once. Tiles are downloaded concurrently,
+    using as many connections as the session allows, each to its own temporary file. As each download finishes the tile
+    is handed to a pool of processes that read it with PDAL, so downloading and reading overlap. This is a generator
+    that yields each tile's points as soon as they are ready, so tiles come out in the order they finish.
+
+    Inputs:
+        tilesKeep: (list) The tiles to download
+        IDToDownload: (int) The ID of the dataset being downloaded
+        cameraLoc_lat: (float) Latitude of camera
+        cameraLoc_lon: (float) Longitude of camera
+        session: (object) Optional getLidar_FTPSession to use. One is made if none is given.
+        numProcesses: (int) Number of processes to read the tiles with. Defaults to the number of CPUs.
+        tmpDir: (str) Optional directory for the temporary tile files. Defaults to the system temporary directory.
+        progressFcn: (function) Optional function called with the fraction of the tiles that are done, each time one is done
+        poly: (object) Optional camera view polygon (see getLidar_CalcViewFrustum). If given, only points inside it are kept.
+        zLims: (list) Optional [min,max] elevation of the points to keep. Either can be None.
+        dmax: (float) Optional maximum distance (in m) from the camera of the points to keep
+
+    Outputs:
+        (generator) Yields (thisFile,lidarXYZsmall) for each tile, where lidarXYZsmall is the XYZ point cloud of the
+        tile as returned by getLidar_Download
+
+    '''
+
+    import numpy as np
+    import os
+    from concurrent.futures import FIRST_COMPLETED,ProcessPoolExecutor,ThreadPoolExecutor,wait
+
+    if len(tilesKeep) == 0:
+        return
+    if poly is not None: # Send just the vertices to the processes #
+        poly = np.asarray(getattr(poly,'vertices',poly),dtype=float)
+
+    ownSession = session is None
+    if ownSession:
+        session = getLidar_FTPSession()
+
+    numDone = 0
+    pending = {}
+    fetches = []
+    decodes = []
+    fetchPool = ThreadPoolExecutor(max_workers=min(session.maxConnections,len(tilesKeep)))
+    decodePool = ProcessPoolExecutor(max_workers=numProcesses)
+    try:
+        for thisFile in tilesKeep:
+            future = fetchPool.submit(getLidar_Fetch,thisFile,IDToDownload,session,tmpDir)
+            fetches.append(future)
+            pending[future] = ('fetch',thisFile)
+        while pending:
+            finished,_ = wait(pending,return_when=FIRST_COMPLETED)
+            for future in finished:
+                step,thisFile = pending.pop(future)
+                if step == 'fetch': # Downloaded, so send it to be read #
+                    fileName = future.result()
+                    decode = decodePool.submit(getLidar_Decode,fileName,cameraLoc_lat,cameraLoc_lon,True,poly,zLims,dmax)
+                    decodes.append(decode)
+                    pending[decode] = ('decode',thisFile)
+                else:
+                    lidarXYZsmall = future.result()
+                    numDone = numDone+1
+                    if progressFcn is not None:
+                        progressFcn(numDone/len(tilesKeep))
+                    yield thisFile,lidarXYZsmall
+    finally:
+        # Drop the work that has not started, and wait for the work that has #
+        for future in fetches+decodes:
+            future.cancel()
+        fetchPool.shutdown(wait=True)
+        decodePool.shutdown(wait=True)
+        for future in fetches: # Downloaded files are left behind if reading failed or was stopped #
+            if not future.cancelled() and future.exception() is None and os.path.exists(future.result()):
+                os.remove(future.result())
+        if ownSession:
+            session.close()
+
+
+
+def getLidar_Fetch(thisFile,IDToDownload,session,tmpDir=None):
+
+    '''
+    Function to download one tile of the selected lidar dataset to a new temporary file, so that many tiles can be
+    downloaded at the same time.
+
+    Inputs:
+        thisFile: (str) The tile to download
+        IDToDownload: (int) The ID of the dataset being downloaded
+        session: (object) The getLidar_FTPSession to use
+        tmpDir: (str) Optional directory for the file. Defaults to the system temporary directory.
+
+    Outputs:
+        fileName: (str) Path to the downloaded file
+
+    '''
+
+    import os
+    import tempfile
+
+    fd,fileName = tempfile.mkstemp(suffix='_'+os.path.basename(thisFile),dir=tmpDir)
+    try:
+        with os.fdopen(fd,'wb') as gfile:
+            session.retrieve(IDToDownload,thisFile,gfile) # Copy the contents of the file on FTP into the local file #
+    except BaseException:
+        os.remove(fileName)
+        raise
+
+    return fileName
+
+
+
+def getLidar_Decode(fileName,cameraLoc_lat,cameraLoc_lon,remove=True,poly=None,zLims=None,dmax=None):
+
+    '''
+    Function to read a downloaded lidar tile with PDAL and convert its points to UTM. Points outside of the view
+    polygon, elevation limits, and maximum distance are dropped by PDAL as the file is read (see getLidar_MakePipeline).
+    Runs in the processes of getLidar_DownloadTiles, so it is kept at the top level of the module.
+
+    Inputs:
+        fileName: (str) Path to the laz file
+        cameraLoc_lat: (float) Latitude of camera
+        cameraLoc_lon: (float) Longitude of camera
+        remove: (bool) If True, delete the file once it has been read
+        poly: (object) Optional camera view polygon (see getLidar_CalcViewFrustum). If given, only points inside it are kept.
+        zLims: (list) Optional [min,max] elevation of the points to keep. Either can be None.
+        dmax: (float) Optional maximum distance (in m) from the camera of the points to keep
+
+    Outputs:
+        lidarXYZsmall: XYZ point cloud, as an nx3 array, of the lidar data
+
+    '''
+
+    import numpy as np
+    import os
+    import pdal
+    import utm
+
+    try:
+        pipeline = getLidar_MakePipeline(fileName,cameraLoc_lat,cameraLoc_lon,poly,zLims,dmax)
+            
+        # Go through the pdal steps to use the pipeline
+        r = pdal.Pipeline(pipeline)  
+        r.validate()  
+        r.execute()
+            
+        # Get the arrays of data and format them so we can use them #
+        datArrays = r.arrays
+        datArrays = datArrays[int(0)] # All of the fields are now accessable with the appropriate index #
+    finally:
+        if remove and os.path.exists(fileName):
+            os.remove(fileName)
+
+    if len(datArrays) == 0: # Nothing in view in this tile #
+        return np.empty([0,3])
+    
+    # Extract x,y,z values #
+    lidarX = datArrays['X']
+    lidarY = datArrays['Y']
+    lidarZ = datArrays['Z']
+
+    # Convert to UTM #
+    utmCoords = utm.from_latlon(lidarY,lidarX)
+    utmCoords = np.hstack([np.reshape(utmCoords[0],[np.size(utmCoords[0]),1]),np.reshape(utmCoords[1],[np.size(utmCoords[1]),1])])
+    lidarX = utmCoords[:,0]
+    lidarY = utmCoords[:,1]
+    
+    # Create and return the final product #
+    lidarXYZsmall = np.vstack((lidarX,lidarY,lidarZ))
+    lidarXYZsmall = np.transpose(lidarXYZsmall)    
+
+    return lidarXYZsmall
+
 
-#=============================================================================#
 
+def getLidar_MakePipeline(fileName,cameraLoc_lat,cameraLoc_lon,poly=None,zLims=None,dmax=None,numPts=8):
 
-#=============================================================================#
-# Prepare and download the chosen dataset
-#=============================================================================#
-def getLidar_GetShapefile(IDToDownload):
-    
     '''
-    Function to get the shapefile of a tile of the chosen lidar dataset. We will use the shapefile
-    to determine if the tile is near the camera, to avoid downloading a bunch of data not near the camera.
-    
+    Function to make the json PDAL pipeline that reads a lidar tile and crops it to the area seen by the camera, so the
+    cropping is done by PDAL before the points are read into Python. The tiles are in lat/lon, so the view polygon (in
+    the UTM zone of the camera) and a circle of radius dmax around the camera are converted to lat/lon polygons for
+    filters.crop. Each polygon edge is split into numPts pieces first, so the crop follows the straight UTM edges.
+    Without a polygon or dmax, points within +-.5 degree x and y of the camera are kept, as before.
+
     Inputs:
-        IDToDownload: (int) ID of chosen lidar dataset, returned by the checkbox from user input.
-        
+        fileName: (str) Path to the laz file
+        cameraLoc_lat: (float) Latitude of camera
+        cameraLoc_lon: (float) Longitude of camera
+        poly: (object) Optional camera view polygon (see getLidar_CalcViewFrustum). If given, only points inside it are kept.
+        zLims: (list) Optional [min,max] elevation of the points to keep. Either can be None.
+        dmax: (float) Optional maximum distance (in m) from the camera of the points to keep
+        numPts: (int) Number of pieces to split each polygon edge into
+
     Outputs:
-        sf: (object) The shapefile of the tiles
-        
+        pipeline: (str) The json pipeline
+
     '''
-    import ftplib
-    import shapefile
-    
-    ftp = ftplib.FTP('ftp.coast.noaa.gov',timeout=1000000)
-    ftp.login('anonymous','anonymous')
-    ftp.cwd('/pub/DigitalCoast')
-    dirs = [i for i in ftp.nlst() if 'lidar' in i]
-    alldirs = []
-    for ii in dirs:
-        ftp.cwd(ii)
-        alldirs.append([ii+'/'+i for i in ftp.nlst() if 'geoid' in i])
-        ftp.cwd('../')
-        
-    # Get into the correct NOAA FTP site ##
-    for i in alldirs:
-        for ii in i:
-            try:
-                ftp.cwd(ii+'/data/'+str(IDToDownload))
-            except:
-                pass
-            else:
-                break
 
-                    
-    files = ftp.nlst()
+    import json
+    import numpy as np
+    import utm
 
-    # Load the datset shapefile and dbf file from the ftp. These describe the tiles #
-    shpFile = str([s for s in files if "shp" in s])
-    shpFile = shpFile[2:len(shpFile)-2]
-    dbfFile = str([s for s in files if "dbf" in s])
-    dbfFile = dbfFile[2:len(dbfFile)-2]
+    camLoc_x,camLoc_y,zone,zoneLetter = utm.from_latlon(cameraLoc_lat,cameraLoc_lon)
+
+    # Polygons to crop to, in UTM #
+    polys = []
+    if poly is not None:
+        v = np.asarray(getattr(poly,'vertices',poly),dtype=float)
+        if len(v)>1 and np.all(v[0] == v[-1]):
+            v = v[:-1]
+        polys.append(v)
+    if dmax is not None:
+        a = np.linspace(0,2*np.pi,64,endpoint=False)
+        r = dmax/np.cos(np.pi/64) # Just outside the circle, so no points within dmax are lost #
+        polys.append(np.column_stack([camLoc_x+r*np.cos(a),camLoc_y+r*np.sin(a)]))
+
+    # Convert them to lat/lon WKT #
+    wkts = []
+    lons = []
+    lats = []
+    for v in polys:
+        s = np.linspace(0,1,numPts,endpoint=False)[:,None,None]
+        v = (v+s*(np.roll(v,-1,axis=0)-v)).transpose(1,0,2).reshape(-1,2)
+        lat,lon = utm.to_latlon(v[:,0],v[:,1],zone,zoneLetter,strict=False)
+        lats.extend([np.min(lat),np.max(lat)])
+        lons.extend([np.min(lon),np.max(lon)])
+        wkts.append('POLYGON(('+','.join([repr(float(x))+' '+repr(float(y)) for x,y in zip(np.append(lon,lon[0]),np.append(lat,lat[0]))])+'))')
+
+    # A quick range filter on the bounding box first, then the crops. Each crop is its own stage, so a point has to be in all of them #
+    if wkts:
+        limits = 'X['+repr(float(max(lons[0::2])))+':'+repr(float(min(lons[1::2])))+'],Y['+repr(float(max(lats[0::2])))+':'+repr(float(min(lats[1::2])))+']'
+    else:
+        limits = 'X['+str(cameraLoc_lon-.5)+':'+str(cameraLoc_lon+.5)+'],Y['+str(cameraLoc_lat-.5)+':'+str(cameraLoc_lat+.5)+']'
+    if zLims is not None:
+        limits = limits+',Z['+('' if zLims[0] is None else str(zLims[0]))+':'+('' if zLims[1] is None else str(zLims[1]))+']'
+    stages = [{'type':'readers.las','filename':fileName},{'type':'filters.range','limits':limits}]
+    for wkt in wkts:
+        stages.append({'type':'filters.crop','polygon':wkt})
 
-    # Write them locally so we can work with them #
-    gfile = open('shapefileCreate.shp','wb') # Create the local file #
-    ftp.retrbinary('RETR '+shpFile,gfile.write)
+    pipeline = json.dumps(stages,sort_keys=False,indent=4)
 
-    gfile = open('shapefileCreate.dbf','wb') # Create the local file #
-    ftp.retrbinary('RETR '+dbfFile,gfile.write)
+    return pipeline
 
-    # Load them into an object using the PyShp library #
-    sf = shapefile.Reader("shapefileCreate.shp")
-    
-    return sf
 
 
-def getLidar_CalcViewArea(az,window,dmax,lat,lon):
+def pointStore_Create(storeFile,sizeHint=0,chunkSize=1000000):
 
     '''
-    Function to calculate a polygon of the expected geographic view area of the camera. The polygon
-    is calculated as a triangle extending dmax km in the azimuth direction of the camera +- a tolerance.
-    Any lidar dataset tiles that intersect with this polygon will be kept.
+    Function to create an empty point store. A point store holds a lidar point cloud as one nx3 array in a .npy file that
+    is memory-mapped while points are added, so the points never all have to be in memory and points already added are
+    never copied. The file grows in chunks as needed. It is written to a temporary file until pointStore_Close is called.
 
     Inputs:
-        az: (float) The estimated azimuth of the camera
-        window: (float) The tolerance to use around az to calculate the polygon (I use 40 degrees)
-        dmax: (float) The maximum distance in the az direction of the camera of the polygon (I use 1 km)
-        lat: (float) The latitude of the camera
-        lon: (float) The longitude of the camera
+        storeFile: (str) Path of the .npy file to make
+        sizeHint: (int) Expected number of points, to set the starting size of the file
+        chunkSize: (int) Smallest number of points to grow the file by
 
     Outputs:
-        poly: (object) The polygon object
-        
+        store: (dict) The point store, with keys:
+            'file': (str) path of the final file
+            'tmpFile': (str) path of the file being written
+            'points': (array) memory-mapped array of the file, including unused rows at the end
+            'count': (int) number of points added so far
+            'chunkSize': (int) smallest number of points to grow the file by
+
     '''
-    from math import sin,cos,tan,sqrt,radians
-    import matplotlib.pyplot as plt
+
     import numpy as np
-    from matplotlib import path
-    import utm
-    
-    # Convert lat lon of camera to UTM #
-    camLoc_x = utm.from_latlon(lat,lon)[0]
-    camLoc_y = utm.from_latlon(lat,lon)[1]
 
-    # Calculate x and y distance to farthest point along azimuthal line #
-    # and lines at angles of az+-window #
-    dx0 = dmax*cos(radians(90-az))
-    dy0 = dmax*sin(radians(90-az))
+    tmpFile = storeFile[:-4]+'.tmp.npy'
+    points = np.lib.format.open_memmap(tmpFile,mode='w+',dtype=np.float64,shape=(max(int(sizeHint),chunkSize),3))
+    store = {'file':storeFile,'tmpFile':tmpFile,'points':points,'count':0,'chunkSize':chunkSize}
 
-    dx1 = dmax*cos(radians(90-(az-window)))
-    dy1 = dmax*sin(radians(90-(az-window)))
+    return store
 
-    dx2 = dmax*cos(radians(90-(az+window)))
-    dy2 = dmax*sin(radians(90-(az+window)))
 
-    # Calculate the verticies of the endpoints, defining the polygon #
-    xmax0 = camLoc_x+dx0
-    ymax0 = camLoc_y+dy0
+def pointStore_Resize(store,size):
 
-    xmax1 = camLoc_x+dx1
-    ymax1 = camLoc_y+dy1
+    '''
+    Function to change the number of rows in a point store's file in place. Only the file's header and length are changed,
+    so the points already in it are not copied. numpy leaves room in the .npy header for the number of rows to grow.
 
-    xmax2 = camLoc_x+dx2
-    ymax2 = camLoc_y+dy2
+    Inputs:
+        store: (dict) The point store returned by pointStore_Create
+        size: (int) New number of rows
 
-    # Create the polygon object #
-    poly = path.Path([(camLoc_x,camLoc_y),(xmax1,ymax1),(xmax0,ymax0),(xmax2,ymax2),(camLoc_x,camLoc_y)])
+    Outputs:
+        None
 
-    return poly   
+    '''
+
+    import numpy as np
 
+    offset = store['points'].offset
+    store['points'].flush()
+    store['points'] = None # Release the file before changing its length #
 
+    with open(store['tmpFile'],'r+b') as f:
+        np.lib.format.write_array_header_1_0(f,{'descr':np.lib.format.dtype_to_descr(np.dtype(np.float64)),'fortran_order':False,'shape':(size,3)})
+        if f.tell() != offset:
+            raise ValueError('The point store header changed size')
+        f.truncate(offset+size*3*8)
 
-def getLidar_SearchTiles(sf,poly,shapeNum,cameraLoc_lat,cameraLoc_lon):
+    store['points'] = np.load(store['tmpFile'],mmap_mode='r+')
+
+
+def pointStore_Append(store,xyz,sizeHint=None):
 
     '''
-    Function to determine if a tile is within the calculated view area of the camera 
-    
-    Inputs: 
-        sf: (object) The shapefile of the tiles returned by getLidar_GetShapefile function
-        poly (object) The camera view polygon object returned by getLidar_CalcViewArea function
-        shapeNum: (int)The tile number
-        cameraLoc_lat: (float) Latitude of camera
-        cameraLoc_lon: (float) Longitude of camera
-    
+    Function to add points to the end of a point store, growing its file if needed.
+
+    Inputs:
+        store: (dict) The point store returned by pointStore_Create
+        xyz: (array) nx3 array of points to add
+        sizeHint: (int) Optional expected total number of points, used to choose the new size if the file has to grow
+
     Outputs:
-        rec['name']: (string) The name of the tile if any part of it is within the view polygon
-        
+        None
+
     '''
-    import utm
-    import math
-    import numpy
-    from matplotlib import path
-    
-    # Establish the location of the camera in UTM coordinates #
-    cameraLoc_UTMx = utm.from_latlon(cameraLoc_lat,cameraLoc_lon)[0]
-    cameraLoc_UTMy = utm.from_latlon(cameraLoc_lat,cameraLoc_lon)[1]
-    
-    # Get the bounding box of the tile in UTM
-    bx = sf.shape(shapeNum).bbox 
-    bx_bl = utm.from_latlon(bx[1],bx[0]) 
-    bx_br = utm.from_latlon(bx[1],bx[2]) 
-    bx_tr = utm.from_latlon(bx[3],bx[2]) 
-    bx_tl = utm.from_latlon(bx[3],bx[0])
 
-    v = poly.vertices
-    
-    # If any edges of the bounding box intersect the polygon, keep the tile. Or, if the entire polygon is within a tile, keep the tile #
-    rec = sf.record(shapeNum)
-    if poly.intersects_path(path.Path([(bx_bl[0],bx_bl[1]),(bx_br[0],bx_br[1])])) or poly.intersects_path(path.Path([(bx_tl[0],bx_tl[1]),(bx_tr[0],bx_tr[1])])) or poly.intersects_path(path.Path([(bx_bl[0],bx_bl[1]),(bx_tl[0],bx_tl[1])])) or poly.intersects_path(path.Path([(bx_br[0],bx_br[1]),(bx_tr[0],bx_tr[1])])):
-        return(rec['Name'])
-    elif bx_bl[0]<v[0][0]<bx_tr[0] and bx_bl[1]<v[0][1]<bx_tr[1] and bx_bl[0]<v[1][0]<bx_tr[0] and bx_bl[1]<v[1][1]<bx_tr[1] and bx_bl[0]<v[2][0]<bx_tr[0] and bx_bl[1]<v[2][1]<bx_tr[1] and bx_bl[0]<v[3][0]<bx_tr[0] and bx_bl[1]<v[3][1]<bx_tr[1] and bx_bl[0]<v[4][0]<bx_tr[0] and bx_bl[1]<v[4][1]<bx_tr[1]:
-        return(rec['Name'])
-                         
+    n = len(xyz)
+    needed = store['count']+n
+    if needed>len(store['points']):
+        size = max(needed,len(store['points'])+store['chunkSize'])
+        if sizeHint is not None:
+            size = max(size,int(sizeHint))
+        pointStore_Resize(store,size)
 
+    store['points'][store['count']:needed] = xyz
+    store['count'] = needed
+
+
+def pointStore_Close(store):
 
-def getLidar_Download(thisFile,IDToDownload,cameraLoc_lat,cameraLoc_lon):
-    
     '''
-    Function to download a tile of the selected lidar dataset using the PDAL module
-    
+    Function to finish a point store. The unused rows are cut off the end of the file, and the file is moved to its final
+    path so a half-written store is never read.
+
     Inputs:
-        thisFile: (str)the tile to download
-        IDToDownload: (int) The ID of the dataset being downloaded
-        cameraLoc_lat: (float) Latitude of camera
-        cameraLoc_lon: (float) Longitude of camera
-        
+        store: (dict) The point store returned by pointStore_Create
+
     Outputs:
-        lidarXYZsmall: XYZ point cloud, as an nx3 array, of the lidar data
-        
+        storeFile: (str) Path of the finished file
+
     '''
-    import ftplib
+
+    import os
+
+    pointStore_Resize(store,store['count'])
+    store['points'].flush()
+    store['points'] = None
+    os.replace(store['tmpFile'],store['file'])
+
+    return store['file']
+
+
+def pointStore_Open(storeFile):
+
+    '''
+    Function to open a finished point store. The points are memory-mapped, so they are read straight from the file as
+    they are used rather than loaded all at once.
+
+    Inputs:
+        storeFile: (str) Path of the .npy file
+
+    Outputs:
+        points: (array) Read-only memory-mapped nx3 array of the points, or None if there is no such file
+
+    '''
+
     import numpy as np
-    import math
-    import json    
-    import pdal
-    import utm
-    
-    # Get to the right FTP #      
-    ftp = ftplib.FTP('ftp.coast.noaa.gov',timeout=1000000)
-    ftp.login('anonymous','anonymous')
-    ftp.cwd('/pub/DigitalCoast')
-    dirs = [i for i in ftp.nlst() if 'lidar' in i]
-    alldirs = []
-    for ii in dirs:
-        ftp.cwd(ii)
-        alldirs.append([ii+'/'+i for i in ftp.nlst() if 'geoid' in i])
-        ftp.cwd('../')
-        
-    # Get into the correct NOAA FTP site ##
-    for i in alldirs:
-        for ii in i:
-            try:
-                ftp.cwd(ii+'/data/'+str(IDToDownload))
-            except:
-                pass
-            else:
-                break
- 
-           
-    # Save the laz file locally #
-    gfile = open('lazfile.laz','wb') # Create the local file #
-    ftp.retrbinary('RETR '+thisFile,gfile.write) # Copy the contents of the file on FTP into the local file #
-    gfile.close() # Close the remote file #
-        
-    # Construct the json PDAL pipeline to read the file and take only points within +-.5 degree x and y of the camera. Read the data in as an array #
-    fullFileName = 'lazfile.laz'
-    pipeline=(json.dumps([{'type':'readers.las','filename':fullFileName},{'type':'filters.range','limits':'X['+str(cameraLoc_lon-.5)+':'+str(cameraLoc_lon+.5)+'],Y['+str(cameraLoc_lat-.5)+':'+str(cameraLoc_lat+.5)+']'}],sort_keys=False,indent=4))
-        
-    # Go through the pdal steps to use the pipeline
-    r = pdal.Pipeline(pipeline)  
-    r.validate()  
-    r.execute()
-        
-    # Get the arrays of data and format them so we can use them #
-    datArrays = r.arrays
-    datArrays = datArrays[int(0)] # All of the fields are now accessable with the appropriate index #
-    
-    # Extract x,y,z values #
-    lidarX = datArrays['X']
-    lidarY = datArrays['Y']
-    lidarZ = datArrays['Z']
+    import os
 
-    # Convert to UTM #
-    utmCoords = utm.from_latlon(lidarY,lidarX)
-    utmCoords = np.hstack([np.reshape(utmCoords[0],[np.size(utmCoords[0]),1]),np.reshape(utmCoords[1],[np.size(utmCoords[1]),1])])
-    lidarX = utmCoords[:,0]
-    lidarY = utmCoords[:,1]
-    
-    # Create and return the final product #
-    lidarXYZsmall = np.vstack((lidarX,lidarY,lidarZ))
-    lidarXYZsmall = np.transpose(lidarXYZsmall)    
+    if not os.path.exists(storeFile):
+        return None
 
-    return lidarXYZsmall
+    points = np.load(storeFile,mmap_mode='r')
+
+    return points
 
 
 
@@ -642,7 +3205,7 @@ def getLidar_CreatePC(lidarDat,cameraLoc_lat,cameraLoc_lon):
     relative to the location of the camera (camera location set as origin)
     
     Inputs:
-        lidarDat: (array) The XYZ lidar point cloud returned by getLidar_Download function
+        lidarDat: (array) The XYZ lidar point cloud returned by getLidar_Download function, or from pointStore_Open
         cameraLoc_lat: (float) Latitude of camera
         cameraLoc_lon: (float) Longitude of camera
     
@@ -964,32 +3527,26 @@ def calibrate_CalcReprojPos(gcps_lidar,calibVals):
 #=============================================================================#
 # Perform Rectification #
 #=============================================================================#
-def rectify_RectifyImage(calibVals,img,grd):
+def rectify_ProjectGrid(calibVals,grd):
 
     '''
-    Function to rectify an image using the resolved calibration parameters. User inputs a grid in real world space
-    onto which the image is rectified.
+    Function to project each cell of a real-world grid into the image with the collinearity equations, using the
+    resolved calibration parameters. Used by rectify_RectifyImage and rectify_GetMap.
 
     Inputs:
         calibVals: (array) The calibration vector returned by calibrate_PerformCalibration function
-        img: (array) The image to be rectified
-        xmin: (float) minimum x-coordinate of real-world grid
-        xmax: (float) maximum x-coordinate of real-world grid
-        dx: (float) spacing in x-direction of the grid
-        ymin: (float) minimum y-coordinate of real-world grid
-        ymax: (float) maximum y-coordinate of real-world grid
-        dy: (float) spacing in y-direction of the grid
-        z: (float) elevation onto which the image is projected #
+        grd: (list) The real-world grid, [xmin,xmax,dx,ymin,ymax,dy,z] (see rectify_RectifyImage)
 
     Outputs:
-        im_rectif: (array) The rectified image
-        extents: (array) The geographic extents of the rectified image, for plotting purposes
+        x: (array) Image x coordinate of each grid cell
+        y: (array) Image y coordinate of each grid cell
+        q: (array) Denominator of the collinearity equations for each grid cell. Cells in front of the camera have q<0.
+        extents: (array) The geographic extents of the grid, for plotting purposes
 
     '''
     import math
     import numpy as np
-    from scipy.interpolate import RegularGridInterpolator as rgi
-    
+
     # Define the calib params #
     omega = calibVals[0]
     phi = calibVals[1]
@@ -1020,8 +3577,40 @@ def rectify_RectifyImage(calibVals,img,grd):
     extents = np.array([(-.5*grd[2])+min(xg),max(xg)+(.5*grd[2]),min(yg)-(.5*grd[5]),max(yg)+(.5*grd[5])])
 
     # Get image coordinates of each desired world coordinate based on calib vals #
-    x = x0 - (f*(((m11*(xgrd-XL)) + (m12*(ygrd-YL)) + (m13*(zgrd-ZL))) / ((m31*(xgrd-XL)) + (m32*(ygrd-YL)) + (m33*(zgrd-ZL)))))
-    y = y0 - (f*(((m21*(xgrd-XL)) + (m22*(ygrd-YL)) + (m23*(zgrd-ZL))) / ((m31*(xgrd-XL)) + (m32*(ygrd-YL)) + (m33*(zgrd-ZL)))))
+    q = (m31*(xgrd-XL)) + (m32*(ygrd-YL)) + (m33*(zgrd-ZL))
+    x = x0 - (f*(((m11*(xgrd-XL)) + (m12*(ygrd-YL)) + (m13*(zgrd-ZL))) / q))
+    y = y0 - (f*(((m21*(xgrd-XL)) + (m22*(ygrd-YL)) + (m23*(zgrd-ZL))) / q))
+
+    return x,y,q,extents
+
+
+def rectify_RectifyImage(calibVals,img,grd):
+
+    '''
+    Function to rectify an image using the resolved calibration parameters. User inputs a grid in real world space
+    onto which the image is rectified.
+
+    Inputs:
+        calibVals: (array) The calibration vector returned by calibrate_PerformCalibration function
+        img: (array) The image to be rectified
+        xmin: (float) minimum x-coordinate of real-world grid
+        xmax: (float) maximum x-coordinate of real-world grid
+        dx: (float) spacing in x-direction of the grid
+        ymin: (float) minimum y-coordinate of real-world grid
+        ymax: (float) maximum y-coordinate of real-world grid
+        dy: (float) spacing in y-direction of the grid
+        z: (float) elevation onto which the image is projected #
+
+    Outputs:
+        im_rectif: (array) The rectified image
+        extents: (array) The geographic extents of the rectified image, for plotting purposes
+
+    '''
+    import numpy as np
+    from scipy.interpolate import RegularGridInterpolator as rgi
+    
+    # Get image coordinates of each desired world coordinate based on calib vals #
+    x,y,q,extents = rectify_ProjectGrid(calibVals,grd)
 
     xx = x.flatten();yy = y.flatten()
     pts = list(zip(xx,yy))
@@ -1053,6 +3642,58 @@ def rectify_RectifyImage(calibVals,img,grd):
     return im_rectif,extents
 
 
+def rectify_GetMap(calibVals,shape,grd):
+    '''
+    Function to compute, once, the image position of each cell of a real-world grid, so that many images from the same camera
+    can be rectified quickly with rectify_RemapImage. Uses the same projection as rectify_RectifyImage.
+
+    Inputs:
+        calibVals: (array) The calibration vector returned by calibrate_PerformCalibration function
+        shape: (tuple) (height,width) of the images to be rectified
+        grd: (list) The real-world grid, [xmin,xmax,dx,ymin,ymax,dy,z] (see rectify_RectifyImage)
+
+    Outputs:
+        mapx: (array) Image column of each rectified pixel (float32), -1 where the grid cell is behind the camera or off the image
+        mapy: (array) Image row of each rectified pixel (float32), -1 where the grid cell is behind the camera or off the image
+        extents: (array) The geographic extents of the rectified image, for plotting purposes
+
+    '''
+    import numpy as np
+
+    # Get image coordinates of each desired world coordinate based on calib vals #
+    x,y,q,extents = rectify_ProjectGrid(calibVals,grd)
+
+    # Pixels behind the camera or off the image are filled with 0 by rectify_RemapImage #
+    bad = (q>=0) | ~np.isfinite(x) | ~np.isfinite(y) | (x<0) | (x>shape[1]-1) | (y<0) | (y>shape[0]-1)
+    x[bad] = -1
+    y[bad] = -1
+
+    mapx = np.flipud(x).astype(np.float32)
+    mapy = np.flipud(y).astype(np.float32)
+
+    return mapx,mapy,extents
+
+
+def rectify_RemapImage(img,mapx,mapy):
+    '''
+    Function to rectify an image with the pixel map from rectify_GetMap.
+
+    Inputs:
+        img: (array) The image to be rectified
+        mapx: (array) Image column of each rectified pixel, from rectify_GetMap
+        mapy: (array) Image row of each rectified pixel, from rectify_GetMap
+
+    Outputs:
+        im_rectif: (array) The rectified image
+
+    '''
+    import cv2
+
+    im_rectif = cv2.remap(img,mapx,mapy,cv2.INTER_LINEAR,borderMode=cv2.BORDER_CONSTANT,borderValue=0)
+
+    return im_rectif
+
+
 
 
 '''
@@ -24,6 +24,9 @@ from PyQt5.QtWidgets import *
 from PyQt5.QtGui import QFont,QMovie
 from PyQt5.QtCore import QThread, pyqtSignal, Qt, QAbstractTableModel,QProcess
 import sys 
+import multiprocessing
+import threading
+from collections import OrderedDict
 import pickle
 import SurfRCaT
 import os
@@ -974,10 +977,23 @@ class inputsAndImagery_ExtractFrames(QWidget):
         
     def initUI(self):
 
-       cap = cv2.VideoCapture(self.vid)
-       numFrames = int(cap.get(7))
-       self.fps = cap.get(5)
-       self.vidLen = int(numFrames/self.fps)
+       # Video lengths come from the video catalog, so videos are only opened the first time they are seen #
+       entries = SurfRCaT.GetVideoCatalog(self.vid if os.path.isdir(self.vid) else [self.vid],pth1+'_cache/videoCatalog.pkl')
+
+       # A folder of videos can be given instead of a single video, in which case frames are extracted from each video #
+       if os.path.isdir(self.vid):
+           vids = [v for v in entries if entries[v]['frames']>0]
+           numFrames = 0
+           self.vidLen = 0
+           for v in vids:
+               numFrames = numFrames+entries[v]['frames']
+               self.vidLen = self.vidLen+int(entries[v]['duration'])
+           self.fps = None
+       else:
+           entry = entries[os.path.abspath(self.vid)]
+           numFrames = entry['frames']
+           self.fps = entry['fps']
+           self.vidLen = int(numFrames/self.fps)
        
        # Left menu box setup #
        bf = QFont()
@@ -1007,6 +1023,9 @@ class inputsAndImagery_ExtractFrames(QWidget):
        txtName = QLabel(self.vid.split('/')[len(self.vid.split('/'))-1])
        labLen = QLabel('Video duration:')
        txtLen = QLabel(str(self.vidLen)+' sec')
+       if os.path.isdir(self.vid):
+           labName = QLabel('Video folder:')
+           txtLen = QLabel(str(self.vidLen)+' sec ('+str(len(vids))+' videos)')
        labFrames = QLabel('Video frames:')
        txtFrames = QLabel(str(numFrames))
        labDir = QLabel('Input your desired decimation rate or number of frames (evenly spaced) below and click Go to begin the video decimation.')
@@ -1019,6 +1038,9 @@ class inputsAndImagery_ExtractFrames(QWidget):
        self.bxTotalFrames = QLineEdit()
        numFramesExt = 0
        self.labNumFrames = QLabel(str(numFramesExt)+' frames will be saved')
+       self.storeBox = QCheckBox('Save frames to a single frame store (faster browsing and rectification)')
+       self.productsBox = QCheckBox('Also make timex, variance, brightest, and darkest images from the frames')
+       self.productsBox.setEnabled(not os.path.isdir(self.vid))
        updateBut = QPushButton('Update')
        self.goBut = QPushButton('Go')
        self.backBut = QPushButton('Back')
@@ -1036,6 +1058,18 @@ class inputsAndImagery_ExtractFrames(QWidget):
        grd1.addWidget(txtLen,1,2,1,4)
        grd1.addWidget(labFrames,2,0,1,2)
        grd1.addWidget(txtFrames,2,2,1,4)
+       self.grd1 = grd1
+       if not os.path.isdir(self.vid): # Show a preview of the whole video, made in the background #
+           self.previewLab = QLabel('Loading preview...')
+           grd1.addWidget(self.previewLab,3,0,1,6)
+           self.previewBut = QPushButton('Choose a frame from the preview')
+           self.previewBut.setEnabled(False)
+           if self.fromRectifWindow is None:
+               grd1.addWidget(self.previewBut,5,0,1,3)
+           self.previewBut.clicked.connect(self.onPreviewClick)
+           self.thumbWorker = ThumbnailsThread(self.vid)
+           self.thumbWorker.finishSignal.connect(self.onThumbnailsSignal)
+           self.thumbWorker.start()
        rightGroupBox1.setLayout(grd1)
        self.grd2.addWidget(labDir,0,0,2,6)
        self.grd2.addWidget(labDec,2,0,1,1)
@@ -1046,6 +1080,8 @@ class inputsAndImagery_ExtractFrames(QWidget):
        self.grd2.addWidget(orLab,4,0,1,1)
        self.grd2.addWidget(labTotalFrames,5,0,1,1)
        self.grd2.addWidget(self.bxTotalFrames,5,1,1,1)
+       self.grd2.addWidget(self.storeBox,6,0,1,6)
+       self.grd2.addWidget(self.productsBox,7,0,1,6)
        rightGroupBox2.setLayout(self.grd2)
        self.grd.addWidget(rightGroupBox1,0,0,3,6)
        self.grd.addWidget(rightGroupBox2,3,0,4,6)
@@ -1120,10 +1156,14 @@ class inputsAndImagery_ExtractFrames(QWidget):
             self.goBut.setEnabled(False)
             self.backBut.setEnabled(False)
             
-            self.worker = DecimateVidThread(self.vid,int(rate),0,self.vidLen,self.fps,self.saveDir)
+            if os.path.isdir(self.vid):
+                self.worker = DecimateVidBatchThread(self.vid,int(rate),0,self.saveDir,self.storeBox.isChecked())
+                self.worker.threadSignal.connect(self.onThreadSignal)
+            else:
+                self.worker = DecimateVidThread(self.vid,int(rate),0,self.vidLen,self.fps,self.saveDir,self.storeBox.isChecked(),self.productsBox.isChecked())
 
-            lab1 = QLabel('Extracting frames...')
-            self.grd.addWidget(lab1,9,0,1,2)
+            self.lab1 = QLabel('Extracting frames...')
+            self.grd.addWidget(self.lab1,9,0,1,2)
 
             self.loadlab = QLabel()
             self.loadmovie = QMovie(pth1+'loading.gif')
@@ -1138,10 +1178,14 @@ class inputsAndImagery_ExtractFrames(QWidget):
             self.goBut.setEnabled(False)
             self.backBut.setEnabled(False)
 
-            self.worker = DecimateVidThread(self.vid,0,int(num),self.vidLen,self.fps,self.saveDir)
+            if os.path.isdir(self.vid):
+                self.worker = DecimateVidBatchThread(self.vid,0,int(num),self.saveDir,self.storeBox.isChecked())
+                self.worker.threadSignal.connect(self.onThreadSignal)
+            else:
+                self.worker = DecimateVidThread(self.vid,0,int(num),self.vidLen,self.fps,self.saveDir,self.storeBox.isChecked(),self.productsBox.isChecked())
 
-            lab1 = QLabel('Extracting frames...')
-            self.grd.addWidget(lab1,9,0,1,2)
+            self.lab1 = QLabel('Extracting frames...')
+            self.grd.addWidget(self.lab1,9,0,1,2)
 
             self.loadlab = QLabel()
             self.loadmovie = QMovie(pth1+'loading.gif')
@@ -1161,6 +1205,45 @@ class inputsAndImagery_ExtractFrames(QWidget):
            msg.setStandardButtons(QMessageBox.Ok)
            msg.show()
 
+    def onThumbnailsSignal(self,thumbs):
+        '''
+        Show the thumbnail strip of the video, in rows of up to 12 thumbnails.
+        '''
+        self.previewLab.setParent(None)
+        if len(thumbs) == 0:
+            return
+
+        perRow = min(12,len(thumbs))
+        blank = np.zeros(thumbs[0].shape,dtype=np.uint8)
+        tiles = list(thumbs)+[blank]*((-len(thumbs))%perRow)
+        strip = np.vstack([np.hstack(tiles[i:i+perRow]) for i in range(0,len(tiles),perRow)])
+
+        canvas = FigureCanvas(Figure())
+        ax = canvas.figure.subplots()
+        ax.imshow(strip)
+        ax.axis('off')
+        canvas.figure.subplots_adjust(left=0,right=1,bottom=0,top=1)
+        canvas.setMinimumHeight(150)
+        canvas.draw()
+        self.grd1.addWidget(canvas,3,0,2,6)
+        self.previewBut.setEnabled(True)
+
+    def onPreviewClick(self):
+        '''
+        Choose the calibration frame from the thumbnails without extracting frames.
+        '''
+        self.close()
+        self.w = inputsAndImagery_ChooseImage(self.vid)
+        self.w.show()
+
+    def onThreadSignal(self,prog):
+        '''
+        Show how many videos are done when extracting frames from a folder of videos.
+        '''
+        self.lab1.setParent(None)
+        self.lab1 = QLabel('Extracting frames ('+str(prog[0])+' of '+str(prog[1])+' videos done)...')
+        self.grd.addWidget(self.lab1,9,0,1,2)
+
     def onFinishSignal(self):
 
         self.loadlab.setParent(None)
@@ -1185,11 +1268,14 @@ class inputsAndImagery_ExtractFrames(QWidget):
 class inputsAndImagery_ChooseImage(QWidget):
     '''
     Window allowing the user to scroll through extracted frames and choose the image they want to use
-    for remote-GCP extraction.
+    for remote-GCP extraction. If a video is given, its thumbnails are shown instead of extracted frames, and only the
+    chosen frame is read from the video at full resolution.
     '''
    
-    def __init__(self):
+    def __init__(self,vid=None):
         super().__init__()    
+
+        self.vid = vid
         
         if not QApplication.instance():
             app = QApplication(sys.argv)
@@ -1243,16 +1329,29 @@ class inputsAndImagery_ChooseImage(QWidget):
        self.grd.addWidget(contBut,6,2,1,1)
 
        # Display the first frame #
-       self.frames1 = os.listdir(pth+'frames/')
-       self.frames = []
-       for f in self.frames1:
-           if f.endswith(".png"):
-               self.frames.append(f)
+       self.store,self.storeIndex = None,None
+       if self.vid is None:
+           self.store,self.storeIndex = SurfRCaT.frameStore_Open(pth+'frames')
+       if self.vid is not None: # Preview the video with its thumbnails #
+           self.thumbs,self.thumbFrames,thumbSecs = SurfRCaT.GetThumbnails(self.vid)
+           self.frames = ['frame'+str(int(sec))+'.png' for sec in thumbSecs]
+       elif self.store is not None: # Frames were saved to a frame store #
+           self.frames = [row[1] for row in self.storeIndex]
+       else:
+           self.frames1 = os.listdir(pth+'frames/')
+           self.frames = []
+           for f in self.frames1:
+               if f.endswith(".png"):
+                   self.frames.append(f)
        self.frame = 0
-       img = mpimg.imread(pth+'frames/'+self.frames[self.frame])
+
+       # Frames around the displayed one are decoded and downsampled in the background, and the one canvas is updated with them #
+       self.prefetcher = prefetchFramesThread(self.readFrame,len(self.frames))
+       self.prefetcher.start()
+       img = self.prefetcher.get(self.frame)
        self.canvas = FigureCanvas(Figure())
        self.ax = self.canvas.figure.subplots()
-       self.ax.imshow(img)
+       self.imPlot = self.ax.imshow(img)
        self.canvas.draw()
           
        self.grd.addWidget(self.canvas,1,0,4,4)
@@ -1289,15 +1388,7 @@ class inputsAndImagery_ChooseImage(QWidget):
 
        if self.frame<len(self.frames)-1:
            self.frame = self.frame+1
-
-           img = mpimg.imread(pth+'frames/'+self.frames[self.frame])
-           self.canvas = FigureCanvas(Figure())
-           self.ax = self.canvas.figure.subplots()
-           self.ax.imshow(img)
-           self.canvas.draw()
-          
-           self.grd.addWidget(self.canvas,1,0,4,4)
-           
+           self.showFrame(self.frame)
        else:
            self.forward.setEnabled(False)
 
@@ -1310,25 +1401,50 @@ class inputsAndImagery_ChooseImage(QWidget):
 
        if self.frame>0:
            self.frame = self.frame-1
-
-           img = mpimg.imread(pth+'frames/'+self.frames[self.frame])
-           self.canvas = FigureCanvas(Figure())
-           self.ax = self.canvas.figure.subplots()
-           self.ax.imshow(img)
-           self.canvas.draw()
-              
-           self.grd.addWidget(self.canvas,1,0,4,4)
+           self.showFrame(self.frame)
        else:
            self.back.setEnabled(False)
 
 
+    def showFrame(self,num):
+        '''
+        Swap the displayed image for a frame, using the prefetched copy if there is one.
+        '''
+        img = self.prefetcher.get(num)
+        self.imPlot.set_data(img)
+        self.imPlot.set_extent((-0.5,img.shape[1]-0.5,img.shape[0]-0.5,-0.5))
+        self.canvas.draw_idle()
+
+    def readFrame(self,num):
+        '''
+        Get a frame (RGB), either from the thumbnails, the frame store, or its png file.
+        '''
+        if self.vid is not None:
+            return self.thumbs[num]
+        elif self.store is not None:
+            return self.store[self.storeIndex[num][0]]
+        else:
+            return cv2.cvtColor(cv2.imread(pth+'frames/'+self.frames[num]),cv2.COLOR_BGR2RGB)
+
+    def closeEvent(self,event):
+        self.prefetcher.stop()
+        event.accept()
+
     def onContClick(self):
         '''
         Save the chosen frame and move to the next step
         '''
         
         frameNumSel = self.frame
-        img = cv2.imread(pth+'frames/'+self.frames[frameNumSel])
+        if self.vid is not None: # Read just the chosen frame from the video #
+            cap = cv2.VideoCapture(self.vid)
+            cap.set(1,int(self.thumbFrames[frameNumSel]))
+            test,img = cap.read()
+            cap.release()
+        elif self.store is not None:
+            img = cv2.cvtColor(self.readFrame(frameNumSel),cv2.COLOR_RGB2BGR)
+        else:
+            img = cv2.imread(pth+'frames/'+self.frames[frameNumSel])
         cv2.imwrite(pth+'products/calibrationImage.png',img)
 
         f = open(pth+'_binaries/camType.pkl','rb')
@@ -1395,6 +1511,12 @@ class inputsAndImagery_ChooseImage(QWidget):
     def onBackButClick(self):
 
         global pth
+        if self.vid is not None: # Back to the frame extraction window the preview came from #
+            self.close()
+            self.ww = inputsAndImagery_ExtractFrames(self.vid,pth+'frames')
+            self.ww.show()
+            return
+
         pth = pth.rsplit('/',2)[0]+'/'
         
         self.close()
@@ -1627,35 +1749,38 @@ class WebCATDownloadUtility(QWidget):
            msg.show()
                   
 
-    def on_threadSignal(self,numVid):
+    def on_threadSignal(self,progress):
+        numVid,numTotal = progress
         self.lab1.setParent(None)
-        self.lab1 = QLabel('Downloading video '+str(numVid)+' of '+str(len(self.yr)))
+        self.lab1 = QLabel('Downloaded '+str(numVid)+' of '+str(numTotal)+' videos')
         self.grd.addWidget(self.lab1,11,0,1,1)
        
 
-    def on_closeSignal(self):
+    def on_closeSignal(self,entries):
          
        '''
        When download video(s) thread is done, function shows a done label and moves on
        '''
        badVid = []
-       for i in range(0,len(self.yr)):
-           if len(self.mo[i]) == 1:
-               self.mo[i] = '0'+self.mo[i]
-           if len(self.day[i]) == 1:
-               self.day[i] = '0'+self.day[i]
-
-           try:
-               if os.stat(self.direc+'/'+self.cameraName+'.'+self.yr[i]+'-'+self.mo[i]+'-'+self.day[i]+'_'+self.hour[i]+'.mp4').st_size <1000:
+       if entries is None: # The dates or hours could not be read as numbers #
+           msg = QMessageBox(self)
+           msg.setIcon(QMessageBox.Critical)
+           txt = ('An error occured. Please ensure you have entered values for all fields correctly.')
+           msg.setText(txt)
+           msg.setWindowTitle('Error')
+           msg.setStandardButtons(QMessageBox.Ok)
+           msg.show()
+       else:
+           for i in range(0,len(self.yr)):
+               if len(self.mo[i]) == 1:
+                   self.mo[i] = '0'+self.mo[i]
+               if len(self.day[i]) == 1:
+                   self.day[i] = '0'+self.day[i]
+
+               # Clips are only moved into place once they are completely downloaded, so a clip missing from the catalog is a missing video #
+               vidFile = self.cameraName+'.'+self.yr[i]+'-'+self.mo[i]+'-'+self.day[i]+'_'+self.hour[i]+'.mp4'
+               if vidFile not in entries or entries[vidFile]['frames'] == 0:
                    badVid.append(i+1)
-           except FileNotFoundError:
-                   msg = QMessageBox(self)
-                   msg.setIcon(QMessageBox.Critical)
-                   txt = ('An error occured. Please ensure you have entered values for all fields correctly.')
-                   msg.setText(txt)
-                   msg.setWindowTitle('Error')
-                   msg.setStandardButtons(QMessageBox.Ok)
-                   msg.show()
                    
                
        if len(badVid)>0:
@@ -1992,6 +2117,7 @@ class lidarData_ChooseLidarSetWindow(QWidget):
             
             self.worker2 = getLidar_DownloadChosenSetThread(cameraLocation[0],cameraLocation[1])
             self.worker2.threadSignal.connect(self.on_threadSignal2)
+            self.worker2.badSignal.connect(self.on_badSignal2)
             
             self.worker3 = getLidar_FormatChosenSetThread(cameraLocation[0],cameraLocation[1])
             ##############################
@@ -2054,6 +2180,20 @@ class lidarData_ChooseLidarSetWindow(QWidget):
     def on_threadSignal2(self,perDone):
         self.pb2.setValue(perDone*100)
         
+    def on_badSignal2(self,err):
+        '''
+        Let the user choose another dataset if the download fails.
+        '''
+        
+        self.loadlab.setParent(None)
+        
+        msg = QMessageBox(self)
+        msg.setIcon(msg.Warning)
+        msg.setText('The lidar data could not be downloaded ('+str(err)+'). Please press OK to choose a different dataset or try again. ')
+        msg.setStandardButtons(msg.Ok)
+        msg.show()
+        msg.buttonClicked.connect(self.chooseOtherSet)
+        
         
     def on_closeSignal2(self):
         '''
@@ -2062,9 +2202,8 @@ class lidarData_ChooseLidarSetWindow(QWidget):
         
         self.loadlab.setParent(None)
 
-        f = open(pth+'_binaries/lidarDat.pkl','rb')
-        ld = pickle.load(f)
-        if len(ld>0):
+        ld = SurfRCaT.pointStore_Open(pth+'_binaries/lidarDat.npy')
+        if ld is not None and len(ld)>0:
         
             lab3 = QLabel('Creating data point cloud...')
         
@@ -2794,11 +2933,13 @@ class rectify_UserInputs(QWidget):
                           'calibration results.')
         introLab.setWordWrap(True)
         introLab1 = QLabel('If you want to rectify frames extracted from a surfcam video, input the video file and directory to save the frames to here. '+
+                           'You can also input a folder of videos, and frames from each video will be saved to their own folder. '+
                            'If you already have frames, you can skip this step.')
         introLab1.setWordWrap(True)
         vidLab = QLabel('Video file:')
         self.vidBx = QLineEdit()
         browseBut0 = QPushButton('Browse')
+        browseBut0b = QPushButton('Browse folder')
         saveLab = QLabel('Directory to save frames:')
         self.saveBx = QLineEdit()
         browseBut00 = QPushButton('Browse')
@@ -2843,8 +2984,9 @@ class rectify_UserInputs(QWidget):
 
         self.grd1.addWidget(introLab1,0,0,1,6)
         self.grd1.addWidget(vidLab,1,0,1,1)
-        self.grd1.addWidget(self.vidBx,1,1,1,4)
-        self.grd1.addWidget(browseBut0,1,5,1,1)
+        self.grd1.addWidget(self.vidBx,1,1,1,3)
+        self.grd1.addWidget(browseBut0,1,4,1,1)
+        self.grd1.addWidget(browseBut0b,1,5,1,1)
         self.grd1.addWidget(saveLab,2,0,1,1)
         self.grd1.addWidget(self.saveBx,2,1,1,4)
         self.grd1.addWidget(browseBut00,2,5,1,1)
@@ -2885,6 +3027,7 @@ class rectify_UserInputs(QWidget):
 
         # Connect widgets with signals #
         browseBut0.clicked.connect(self.onBrowse0Click)
+        browseBut0b.clicked.connect(self.onBrowse0bClick)
         browseBut00.clicked.connect(self.onBrowse00Click)
         extractStillsBut.clicked.connect(self.onDecimateClick)
         browseBut1.clicked.connect(self.onBrowse1Click)
@@ -2928,14 +3071,25 @@ class rectify_UserInputs(QWidget):
             
            self.vidBx.setText(self.vidFile)
 
+   def onBrowse0bClick(self):
+       dlg = QFileDialog()
+       dlg.setFileMode(QFileDialog.Directory)
+       if dlg.exec_():
+           direc = dlg.selectedFiles()
+           self.vidFile = direc[0]
+            
+           self.vidBx.setText(self.vidFile)
+
    def onDecimateClick(self):
 
        os.mkdir(self.frameSaveDirec+'/frames')
        saveDir = self.frameSaveDirec+'/frames'
-       
-       self.inputDirec = saveDir
-       self.inputDirecBx.setText(self.inputDirec)
-       self.browsePresses +=1
+
+       # Frames from a folder of videos go to a folder per video, so the user chooses which folder to rectify #
+       if not os.path.isdir(self.vidFile):
+           self.inputDirec = saveDir
+           self.inputDirecBx.setText(self.inputDirec)
+           self.browsePresses +=1
        
        self.w = inputsAndImagery_ExtractFrames(self.vidFile,saveDir,1)
        self.w.show()
@@ -3015,7 +3169,11 @@ class rectify_UserInputs(QWidget):
             dy = float(dy)
             z = [float(i) for i in z1]
             grd = [xmin,xmax,dx,ymin,ymax,dy,z]
-            self.numIms = len(os.listdir(self.inputDirec))
+            store,storeIndex = SurfRCaT.frameStore_Open(self.inputDirec)
+            if store is not None:
+                self.numIms = len(storeIndex)
+            else:
+                self.numIms = len(os.listdir(self.inputDirec))
 
             if len(z) != self.numIms:
                 msg = QMessageBox(self)
@@ -3113,40 +3271,28 @@ class DownloadVidThread(QThread):
         
        print('Thread Started')
 
-       vidNum = 0
-       for i in range(0,len(self.year)):
-           vidNum = vidNum+1
-           self.threadSignal.emit(vidNum)
-           try:           
-               yr = int(self.year[i])
-               mo = int(self.month[i])
-               d = int(self.day[i])
-               hr = int(self.hour[i])
-           except:
-               self.finishSignal.emit(1)
+       try:
+           yr = [int(i) for i in self.year]
+           mo = [int(i) for i in self.month]
+           d = [int(i) for i in self.day]
+           hr = [int(i) for i in self.hour]
+       except ValueError:
+           self.finishSignal.emit(None)
+       else:
+           # Check which clips exist first so that we only request real ones #
+           available = SurfRCaT.GetWebCATAvailability(self.cam,yr,mo,d,hr,indexFile=pth1+'_cache/'+self.cam+'_availability.pkl')
+           keep = [i for i in range(0,len(yr)) if available[i]]
 
-           if mo<10:
-               mo = '0'+str(mo)
-           else:
-               mo = str(mo)
-    
-           if d<10:
-               d = '0'+str(d)
-           else:
-               d = str(d)
+           # Download the clips concurrently, reporting each finished clip out of the clips that exist #
+           self.threadSignal.emit((0,len(keep)))
+           SurfRCaT.GetWebCATVideos(self.direc+'/',self.cam,[yr[i] for i in keep],[mo[i] for i in keep],[d[i] for i in keep],[hr[i] for i in keep],
+                                    progressFcn=lambda numDone: self.threadSignal.emit((numDone,len(keep))))
 
-           if hr<1000:
-               hr = '0'+str(hr)
-           else:
-               hr = str(hr)
+           # Add the clips to the video catalog, keyed by clip file name for the window #
+           vidFiles = [self.direc+'/'+SurfRCaT.GetWebCATURL(self.cam,yr[i],mo[i],d[i],hr[i])[1] for i in range(0,len(yr))]
+           entries = SurfRCaT.GetVideoCatalog(vidFiles,pth1+'_cache/videoCatalog.pkl',checksum=True)
 
-           print(self.direc+'/'+self.cam+'.'+str(yr)+'-'+str(mo)+'-'+str(d)+'_'+str(hr)+'.mp4')
-           if not os.path.exists(self.direc+'/'+self.cam+'.'+str(yr)+'-'+str(mo)+'-'+str(d)+'_'+str(hr)+'.mp4'): # Only download if the file doesn't already exist #
-               vidFile = SurfRCaT.GetWebCATVideo(self.direc+'/',self.cam,int(yr),int(mo),int(d),int(hr))
-           else:
-               pass
-           
-       self.finishSignal.emit(1)   
+           self.finishSignal.emit({os.path.basename(v):entries[v] for v in entries})   
         
        print('Thread Done')
  
@@ -3157,7 +3303,7 @@ class DecimateVidThread(QThread):
     '''
     finishSignal = pyqtSignal('PyQt_PyObject')
 
-    def __init__(self,vid,rate,numFrames,vidLen,fps,saveDir):
+    def __init__(self,vid,rate,numFrames,vidLen,fps,saveDir,store=False,products=False):
        super().__init__()
 
        self.vid = vid
@@ -3166,6 +3312,8 @@ class DecimateVidThread(QThread):
        self.vidLen = vidLen
        self.fps = fps
        self.saveDir = saveDir
+       self.store = store
+       self.products = products
         
     def run(self):
         
@@ -3177,7 +3325,13 @@ class DecimateVidThread(QThread):
        else: # If the rate is not zero, then the user entered a rate #
            secondsPerFrame = 1
 
-       SurfRCaT.GetStills(self.vid,secondsPerFrame,self.rate,self.vidLen,self.fps,self.saveDir)
+       # Image products go in a products folder next to the frames folder, and are made from the frames as they are extracted #
+       productsDir = None
+       if self.products:
+           productsDir = os.path.dirname(os.path.abspath(self.saveDir))+'/products'
+           os.makedirs(productsDir,exist_ok=True)
+
+       SurfRCaT.GetStills(self.vid,secondsPerFrame,self.rate,self.vidLen,self.fps,self.saveDir,numProcesses=os.cpu_count() or 1,store=self.store,productsDir=productsDir)
 
         
        self.finishSignal.emit(1) 
@@ -3185,6 +3339,139 @@ class DecimateVidThread(QThread):
        print('Thread Done')
        
        
+class DecimateVidBatchThread(QThread):
+    ''' 
+    Worker thread to decimate each video in a folder to images at user-specified rate.
+    '''
+    threadSignal = pyqtSignal('PyQt_PyObject')
+    finishSignal = pyqtSignal('PyQt_PyObject')
+
+    def __init__(self,vidDir,rate,numFrames,saveDir,store=False):
+       super().__init__()
+
+       self.vidDir = vidDir
+       self.rate = rate
+       self.numFrames = numFrames
+       self.saveDir = saveDir
+       self.store = store
+        
+    def run(self):
+        
+       print('Thread Started')
+
+       SurfRCaT.GetStills_Batch(self.vidDir,self.rate,self.numFrames,self.saveDir,progressFcn=lambda done,total: self.threadSignal.emit([done,total]),store=self.store,
+                                catalogFile=pth1+'_cache/videoCatalog.pkl')
+        
+       self.finishSignal.emit(1) 
+        
+       print('Thread Done')
+       
+       
+class ThumbnailsThread(QThread):
+    ''' 
+    Worker thread to make (or load the cached) thumbnail strip of a video.
+    '''
+    finishSignal = pyqtSignal('PyQt_PyObject')
+
+    def __init__(self,vid):
+       super().__init__()
+
+       self.vid = vid
+        
+    def run(self):
+        
+       print('Thread Started')
+
+       try:
+           thumbs,frames,secs = SurfRCaT.GetThumbnails(self.vid)
+       except Exception:
+           thumbs = []
+        
+       self.finishSignal.emit(thumbs) 
+        
+       print('Thread Done')
+
+
+class prefetchFramesThread(QThread):
+    ''' 
+    Worker thread to decode and downsample the frames around the one being displayed, keeping them in a bounded
+    least-recently-used cache so that scrolling through frames does not wait on reading them.
+    '''
+
+    def __init__(self,loadFcn,numFrames,radius=4,maxSize=24,maxDim=1280):
+       super().__init__()
+
+       self.loadFcn = loadFcn
+       self.numFrames = numFrames
+       self.radius = radius
+       self.maxSize = max(maxSize,(2*radius)+1)
+       self.maxDim = maxDim
+       self.cache = OrderedDict()
+       self.lock = threading.Lock()
+       self.wake = threading.Event()
+       self.center = 0
+       self.stopped = False
+
+    def load(self,num):
+       '''
+       Read a frame and downsample it so its largest side is at most maxDim.
+       '''
+       img = self.loadFcn(num)
+       scale = self.maxDim/max(img.shape[0],img.shape[1])
+       if scale<1:
+           img = cv2.resize(img,(int(img.shape[1]*scale),int(img.shape[0]*scale)),interpolation=cv2.INTER_AREA)
+       return img
+
+    def put(self,num,img):
+       with self.lock:
+           self.cache[num] = img
+           self.cache.move_to_end(num)
+           while len(self.cache)>self.maxSize:
+               self.cache.popitem(last=False)
+
+    def get(self,num):
+       '''
+       Get a frame from the cache (reading it now if it is not there yet) and prefetch the frames around it.
+       '''
+       with self.lock:
+           img = self.cache.get(num)
+           if img is not None:
+               self.cache.move_to_end(num)
+       if img is None:
+           img = self.load(num)
+           self.put(num,img)
+
+       self.center = num
+       self.wake.set()
+       return img
+
+    def stop(self):
+       self.stopped = True
+       self.wake.set()
+       self.wait()
+        
+    def run(self):
+        
+       print('Thread Started')
+
+       while not self.stopped:
+           self.wake.wait()
+           self.wake.clear()
+
+           # Nearest frames first, the next ones before the previous ones #
+           center = self.center
+           for d in range(1,self.radius+1):
+               for num in (center+d,center-d):
+                   if self.stopped or self.wake.is_set() or num<0 or num>=self.numFrames:
+                       continue
+                   with self.lock:
+                       cached = num in self.cache
+                   if not cached:
+                       self.put(num,self.load(num))
+                     
+       print('Thread Done')
+       
+
 class getLidar_FindCloseDatasetIDsThread(QThread):
 
     '''
@@ -3203,7 +3490,7 @@ class getLidar_FindCloseDatasetIDsThread(QThread):
         
         print('Thread Started')
         
-        IDs = SurfRCaT.getLidar_FindPossibleIDs(self.cameraLoc_lat,self.cameraLoc_lon)
+        IDs = SurfRCaT.getLidar_FindPossibleIDs(self.cameraLoc_lat,self.cameraLoc_lon,catalogFile=pth1+'_cache/lidarCatalog.pkl')
 
         print('Thread Done')   
 
@@ -3239,35 +3526,16 @@ class getLidar_FindCoveringDatasetsThread(QThread):
         if not IDs:
             self.badSignal.emit(1)
         else: 
-            ftp = ftplib.FTP('ftp.coast.noaa.gov',timeout=1000000)
-            ftp.login('anonymous','anonymous')
+            # Only datasets whose tile extents haven't been indexed before need to be read from the FTP site #
+            session = SurfRCaT.getLidar_FTPSession(pth1+'_cache/lidarPaths.pkl')
+            index = SurfRCaT.getLidar_UpdateExtentIndex(pth1+'_cache/lidarExtents.pkl',IDs,session,progressFcn=self.threadSignal.emit)
+            session.close()
+            self.threadSignal.emit(1)
+
+            appropID = SurfRCaT.getLidar_QueryExtentIndex(index,self.cameraLoc_lat,self.cameraLoc_lon,IDs) # IDs which contain the camera location #
+            print(appropID)
             
-            # Get a list of all lidar directories. These get updated through time so always need to check. #
-            ftp.cwd('/pub/DigitalCoast')
-            dirs = [i for i in ftp.nlst() if 'lidar' in i]
-            alldirs = []
-            for ii in dirs:
-                ftp.cwd(ii)
-                alldirs.append([ii+'/'+i for i in ftp.nlst() if 'geoid' in i])
-                ftp.cwd('../')  
-
-            
-            appropID = list() # Initiate list of IDs which contain the camera location #
-            i = 0
-            for ID in IDs:
-                i = i+1
-                perDone = i/len(IDs)
-                self.threadSignal.emit(perDone)  
-
-                check = SurfRCaT.getLidar_TryID(ftp,alldirs,ID,self.cameraLoc_lat,self.cameraLoc_lon,pth+'_binaries/')
-                ftp.cwd('/pub/DigitalCoast')
-                
-                if check:
-                    if len(check)>0:       
-                        appropID.append(ID)
-                        print(appropID)
-            
-            matchingTable = SurfRCaT.getLidar_GetDatasetNames(appropID)
+            matchingTable = SurfRCaT.getLidar_GetDatasetNames(appropID,catalogFile=pth1+'_cache/lidarCatalog.pkl')
             
             # Remove the strange Puerto Rico dataset that always shows up #
             idxNames = matchingTable[matchingTable['ID']==8560].index
@@ -3315,7 +3583,7 @@ class getLidar_WebCATThread(QThread):
         else:
             IDs = [6330,8713,5185,5184,5038,8608,520,34,37,19,8]
 
-        matchingTable = SurfRCaT.getLidar_GetDatasetNames(IDs)
+        matchingTable = SurfRCaT.getLidar_GetDatasetNames(IDs,catalogFile=pth1+'_cache/lidarCatalog.pkl')
 
                       
         print('Thread Done')
@@ -3347,30 +3615,29 @@ class getLidar_PrepChosenSetThread(QThread):
                 
         f = open(pth+'_binaries/chosenLidarID.pkl','rb')
         f1 = open(pth+'_binaries/az.pkl','rb')
+        f2 = open(pth+'_binaries/ZL.pkl','rb')
         IDToDownload = pickle.load(f)
         az = pickle.load(f1)
+        ZL = pickle.load(f2)
+        img = cv2.imread(pth+'products/calibrationImage.png')
 
         self.threadSignal.emit(0)
         
-        sf = SurfRCaT.getLidar_GetShapefile(IDToDownload)
-        poly = SurfRCaT.getLidar_CalcViewArea(az,20,500,self.cameraLoc_lat,self.cameraLoc_lon)
-        
-        tilesKeep = list()
-        i = 0
-        for shapeNum in range(0,len(sf)):
-
-            out = SurfRCaT.getLidar_SearchTiles(sf,poly,shapeNum,self.cameraLoc_lat,self.cameraLoc_lon)
-            if out:
-                tilesKeep.append(out)
-
-            i = i+1
-            perDone = i/len(sf)
-            self.threadSignal.emit(perDone)
-
+        session = SurfRCaT.getLidar_FTPSession(pth1+'_cache/lidarPaths.pkl')
+        table = SurfRCaT.getLidar_GetTileTable(IDToDownload,'shapefile',session,pth1+'_cache/lidarTiles')
+        session.close()
+        # View area from the initial camera model (same assumed tilt and focal length as the calibration) #
+        fl,x0,y0 = SurfRCaT.calibrate_GetInitialApprox_IOPs(img)
+        poly = SurfRCaT.getLidar_CalcViewFrustum(az,80,fl,img.shape[1],img.shape[0],ZL,self.cameraLoc_lat,self.cameraLoc_lon,500)
         
+        # Test every tile against the view area at once #
+        tilesKeep = SurfRCaT.getLidar_SearchTilesAll(table,poly,self.cameraLoc_lat,self.cameraLoc_lon)
+        self.threadSignal.emit(1)
 
         with open(pth+'_binaries/tilesKeep.pkl','wb') as f:
             pickle.dump(tilesKeep,f)
+        with open(pth+'_binaries/viewArea.pkl','wb') as f: # So the download can crop the tiles to it #
+            pickle.dump(poly.vertices,f)
             
         self.finishSignal.emit(1)
         
@@ -3386,6 +3653,7 @@ class getLidar_DownloadChosenSetThread(QThread):
 
     threadSignal = pyqtSignal('PyQt_PyObject')
     finishSignal = pyqtSignal('PyQt_PyObject')
+    badSignal = pyqtSignal('PyQt_PyObject')
 
     def __init__(self,cameraLoc_lat,cameraLoc_lon):
         super().__init__()
@@ -3400,22 +3668,34 @@ class getLidar_DownloadChosenSetThread(QThread):
         
         f = open(pth+'_binaries/chosenLidarID.pkl','rb')
         IDToDownload = pickle.load(f)
+
+        # Crop the tiles to the view area as they are read #
+        poly = None
+        if os.path.exists(pth+'_binaries/viewArea.pkl'):
+            f = open(pth+'_binaries/viewArea.pkl','rb')
+            poly = pickle.load(f)
         
-        i = 0
-        lidarDat = np.empty([0,3])
+        # Points go straight into a memory-mapped file as each tile finishes #
+        store = SurfRCaT.pointStore_Create(pth+'_binaries/lidarDat.npy')
+        numTiles = 0
         self.threadSignal.emit(.01)
-        for thisFile in tilesKeep:
-            
-            lidarXYZsmall = SurfRCaT.getLidar_Download(thisFile,IDToDownload,self.cameraLoc_lat,self.cameraLoc_lon)
-            
-            lidarDat = np.append(lidarDat,lidarXYZsmall,axis=0)
-
-            i = i+1
-            perDone = i/len(tilesKeep)
-            self.threadSignal.emit(perDone)
-
-        with open(pth+'_binaries/lidarDat.pkl','wb') as f:
-            pickle.dump(lidarDat,f)
+        session = SurfRCaT.getLidar_FTPSession(pth1+'_cache/lidarPaths.pkl') # One login and directory search for all the tiles #
+        
+        # Tiles are downloaded and read in parallel, and come back as they finish #
+        try:
+            for thisFile,lidarXYZsmall in SurfRCaT.getLidar_DownloadTiles(tilesKeep,IDToDownload,self.cameraLoc_lat,self.cameraLoc_lon,session,progressFcn=self.threadSignal.emit,poly=poly):
+                
+                # Expect the rest of the tiles to be like the ones read so far, counting this one #
+                numTiles = numTiles+1
+                sizeHint = (store['count']+len(lidarXYZsmall))/numTiles*len(tilesKeep)
+                SurfRCaT.pointStore_Append(store,lidarXYZsmall,sizeHint=sizeHint)
+        except Exception as e: # Tell the user rather than leave the window waiting #
+            print(e)
+            self.badSignal.emit(e)
+            return
+        finally:
+            session.close()
+            SurfRCaT.pointStore_Close(store)
             
         self.finishSignal.emit(1)   
         
@@ -3441,8 +3721,7 @@ class getLidar_FormatChosenSetThread(QThread):
 
         print('Thread Started')
         
-        f = open(pth+'_binaries/lidarDat.pkl','rb')
-        lidarDat = pickle.load(f)
+        lidarDat = SurfRCaT.pointStore_Open(pth+'_binaries/lidarDat.npy')
 
         f2 = open(pth+'_binaries/CameraName.pkl','rb')
         camName = str(pickle.load(f2))
@@ -3738,7 +4017,11 @@ class performRectificationThread(QThread):
 
         f = open(self.calibFile,'rb')
         calibVals = pickle.load(f)
-        images = os.listdir(self.inputDirec)
+        store,storeIndex = SurfRCaT.frameStore_Open(self.inputDirec)
+        if store is not None: # Frames were saved to a frame store #
+            images = [row[1] for row in storeIndex]
+        else:
+            images = os.listdir(self.inputDirec)
 
         num = 0
         for im in images:
@@ -3746,7 +4029,10 @@ class performRectificationThread(QThread):
             self.threadSignal.emit(num)
             
             grdUse = [self.grd[0],self.grd[1],self.grd[2],self.grd[3],self.grd[4],self.grd[5],self.grd[6][num-1]] # Get this image's z-value #
-            img = mpimg.imread(self.inputDirec+'/'+im)
+            if store is not None:
+                img = store[storeIndex[num-1][0]].astype(np.float32)/255 # Same values as reading the frame's png #
+            else:
+                img = mpimg.imread(self.inputDirec+'/'+im)
             try:
                 im_rectif,extents = SurfRCaT.rectify_RectifyImage(calibVals,img,grdUse) # Perform the rectification #
                     
@@ -3799,6 +4085,7 @@ class performRectificationThread(QThread):
 
 # Launch the tool #       
 if __name__ == '__main__':
+    multiprocessing.freeze_support()     # Needed for the process pools used by SurfRCaT.py in the frozen app
     appctxt = ApplicationContext()       # 1. Instantiate ApplicationContext
     w = WelcomeWindow()
     exit_code = appctxt.app.exec_()      # 2. Invoke appctxt.app.exec_()